@@ -0,0 +1,83 @@
+import importlib.util
+import os
+import threading
+import time
+
+import pytest
+
+# device.py has no dependencies; load it directly so the test doesn't need the Xi-cam GUI stack
+_spec = importlib.util.spec_from_file_location(
+    'device', os.path.join(os.path.dirname(__file__), '..', 'xicam', 'Acquire', 'devices', 'device.py'))
+device = importlib.util.module_from_spec(_spec)
+_spec.loader.exec_module(device)
+
+THREADS = 32
+
+
+class SlowDevice(object):
+    instances = []
+    failures = 0
+
+    def __init__(self, prefix, name):
+        time.sleep(.05)  # long enough for every thread to pile up on the construction
+        if SlowDevice.failures:
+            SlowDevice.failures -= 1
+            raise RuntimeError('construction failed')
+        self.prefix = prefix
+        self.name = name
+        SlowDevice.instances.append(self)
+
+
+@pytest.fixture(autouse=True)
+def reset():
+    SlowDevice.instances = []
+    SlowDevice.failures = 0
+    device._shared_devices.clear()
+
+
+def race(wrappers):
+    barrier = threading.Barrier(len(wrappers))
+    results = [None] * len(wrappers)
+
+    def access(i):
+        barrier.wait()
+        try:
+            results[i] = wrappers[i].device_obj
+        except RuntimeError as ex:
+            results[i] = ex
+
+    threads = [threading.Thread(target=access, args=(i,)) for i in range(len(wrappers))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
+
+
+def test_single_flight():
+    results = race([device.Device('cam', 'XF:CAM:', 'AreaDetector', SlowDevice) for _ in range(THREADS)])
+
+    assert len(SlowDevice.instances) == 1
+    assert all(result is SlowDevice.instances[0] for result in results)
+
+
+def test_failure_is_shared_and_retried():
+    SlowDevice.failures = 1
+    wrappers = [device.Device('cam', 'XF:CAM:', 'AreaDetector', SlowDevice) for _ in range(THREADS)]
+
+    results = race(wrappers)
+    assert all(isinstance(result, RuntimeError) for result in results)
+    assert not SlowDevice.instances
+
+    results = race(wrappers)
+    assert len(SlowDevice.instances) == 1
+    assert all(result is SlowDevice.instances[0] for result in results)
+
+
+def test_keyed_by_name():
+    first = device.Device('cam', 'XF:CAM:', 'AreaDetector', SlowDevice).device_obj
+    renamed = device.Device('detector', 'XF:CAM:', 'AreaDetector', SlowDevice).device_obj
+
+    assert first is not renamed
+    assert renamed.name == 'detector'
+    assert device.Device('cam', 'XF:CAM:', 'AreaDetector', SlowDevice).device_obj is first
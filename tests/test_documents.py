@@ -0,0 +1,95 @@
+import importlib.util
+import io
+import logging
+import os
+import time
+
+import numpy as np
+import pytest
+
+pytest.importorskip('xicam.core.msg')
+
+# documents.py only needs NumPy and xicam.core.msg; load it directly so the test doesn't start the run engine
+_spec = importlib.util.spec_from_file_location(
+    'documents', os.path.join(os.path.dirname(__file__), '..', 'xicam', 'Acquire', 'documents.py'))
+documents = importlib.util.module_from_spec(_spec)
+_spec.loader.exec_module(documents)
+
+N = 10000
+
+
+@pytest.fixture
+def root_logger():
+    # msg.logMessage reconfigures the root logger; give each test a clean one
+    root = logging.getLogger()
+    handlers, level = root.handlers[:], root.level
+    root.handlers = []
+    root.setLevel(logging.WARNING)
+    yield root
+    root.handlers = handlers
+    root.setLevel(level)
+
+
+def events(count=N):
+    for i in range(count):
+        yield {'uid': str(i), 'seq_num': i + 1, 'time': time.time(), 'descriptor': 'descriptor',
+               'data': {'det': float(i), 'image': np.zeros((4, 4))}, 'timestamps': {'det': 0., 'image': 0.}}
+
+
+def test_enabled_follows_logger_hierarchy():
+    isEnabledFor = documents.DocumentLogger.isEnabledFor
+    # A private hierarchy, away from the handlers pytest puts on the root logger
+    parent = logging.getLogger('test_documents')
+    parent.propagate = False
+    logger = logging.getLogger('test_documents.child')
+    logger.setLevel(logging.DEBUG)
+
+    # Without handlers, logging falls back to its last resort handler, which only takes warnings
+    assert not isEnabledFor(logging.INFO, logger)
+    assert isEnabledFor(logging.WARNING, logger)
+
+    handler = logging.StreamHandler(io.StringIO())
+    handler.setLevel(logging.INFO)
+    parent.addHandler(handler)
+    try:
+        assert isEnabledFor(logging.INFO, logger)
+        assert not isEnabledFor(logging.DEBUG, logger)
+        # Handlers above a logger that doesn't propagate are never reached
+        logger.propagate = False
+        assert not isEnabledFor(logging.INFO, logger)
+        logger.propagate = True
+        # msg's handler takes every message; msg sets it to each message's level
+        parent.addHandler(documents.msg.stdch)
+        assert isEnabledFor(logging.DEBUG, logger)
+    finally:
+        parent.handlers = []
+        logger.propagate = True
+
+
+def test_overhead(root_logger):
+    event_docs = list(events())
+
+    # Nothing would record the documents: the logger returns before formatting anything. 10k events stay well under
+    # 10 us each, next to the milliseconds the RunEngine itself spends per event
+    document_logger = documents.DocumentLogger()
+    start = time.perf_counter()
+    for event in event_docs:
+        document_logger('event', event)
+    disabled = time.perf_counter() - start
+    assert disabled < .1
+
+    # Recorded: each document is summarized, with arrays reduced to their shape, and capped in length
+    stream = io.StringIO()
+    root_logger.addHandler(logging.StreamHandler(stream))
+    root_logger.setLevel(logging.DEBUG)
+    document_logger = documents.DocumentLogger(maxlength=200)
+    start = time.perf_counter()
+    for event in event_docs:
+        document_logger('event', event)
+    enabled = time.perf_counter() - start
+
+    lines = stream.getvalue().splitlines()
+    assert len(lines) == N
+    assert 'shape=(4, 4)' in lines[0]
+    assert max(map(len, lines)) < 300
+    assert disabled < enabled
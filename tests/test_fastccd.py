@@ -0,0 +1,63 @@
+import importlib.util
+import os
+
+import pytest
+
+pytest.importorskip('ophyd')
+
+from ophyd import Signal
+
+# fastccd.py only needs ophyd; load it directly so the test doesn't need the Xi-cam GUI stack
+_spec = importlib.util.spec_from_file_location(
+    'fastccd', os.path.join(os.path.dirname(__file__), '..', 'xicam', 'Acquire', 'devices', 'fastccd.py'))
+fastccd = importlib.util.module_from_spec(_spec)
+_spec.loader.exec_module(fastccd)
+
+
+class CountingSignal(Signal):
+    reads = 0
+    writes = 0
+
+    def get(self, **kwargs):
+        CountingSignal.reads += 1
+        return super().get(**kwargs)
+
+    def set(self, value, **kwargs):
+        CountingSignal.writes += 1
+        return super().set(value, **kwargs)
+
+
+@pytest.fixture
+def exposure():
+    CountingSignal.reads = CountingSignal.writes = 0
+    return fastccd.TriggeredCamExposure(name='exposure')
+
+
+def test_repeated_writes_are_skipped_without_reading(exposure):
+    signal = CountingSignal(name='acquire_time', value=0)
+    exposure._write(signal, .1 + .2).wait(1)
+    CountingSignal.reads = CountingSignal.writes = 0
+    # A recomputed value that differs only in the last bits is the same setting
+    assert exposure._write(signal, .3) is None
+    assert CountingSignal.writes == 0
+    assert CountingSignal.reads == 0
+
+
+def test_outside_changes_are_written_again(exposure):
+    signal = CountingSignal(name='acquire_time', value=0)
+    exposure._write(signal, 1.).wait(1)
+    # Another client changes the PV; its monitor tells us our value no longer holds
+    signal.put(2.)
+    status = exposure._write(signal, 1.)
+    assert status is not None
+    status.wait(1)
+    assert signal.get() == 1.
+    assert exposure._write(signal, 1.) is None
+
+
+def test_tolerance(exposure):
+    signal = CountingSignal(name='acquire_period', value=0)
+    signal.tolerance = .01
+    exposure._write(signal, 1.).wait(1)
+    assert exposure._write(signal, 1.005) is None
+    assert exposure._write(signal, 1.02) is not None
@@ -0,0 +1,88 @@
+import importlib.util
+import os
+import tracemalloc
+
+import numpy as np
+
+# frames.py only needs NumPy; load it directly so the test doesn't need the Xi-cam GUI stack
+_spec = importlib.util.spec_from_file_location(
+    'frames', os.path.join(os.path.dirname(__file__), '..', 'xicam', 'Acquire', 'controllers', 'frames.py'))
+frames = importlib.util.module_from_spec(_spec)
+_spec.loader.exec_module(frames)
+
+FACTOR = 4
+
+
+def detector_frame(seed=0):
+    return np.random.RandomState(seed).randint(0, 4000, (2048, 2048)).astype(np.uint16)
+
+
+def test_latest_frame_wins():
+    buffer = frames.FrameBuffer()
+    assert buffer.take() is None
+    assert buffer.put('first')
+    assert not buffer.put('second')
+    assert buffer.take() == 'second'
+    assert buffer.take() is None
+    assert (buffer.displayed, buffer.dropped) == (1, 1)
+
+
+def test_reader_never_writes_pending_or_displayed_frames():
+    buffer = frames.FrameBuffer()
+    shape = frames.decimated_shape((2048, 2048), FACTOR)
+    for i in range(20):
+        out = buffer.buffer(shape, np.float32)
+        assert out is not buffer._front and out is not buffer._pending
+        out[...] = i
+        buffer.put(out)
+        if i % 3 == 0:
+            # The GUI only gets to some of the frames, and always gets the newest
+            assert buffer.take()[0, 0] == i
+    assert len({id(array) for array in buffer._pool}) == 3
+
+
+def test_decimate():
+    frame = detector_frame()
+    binned = frames.decimate(frame[:1023, :1022], FACTOR)
+    # Edge rows and columns that don't fill a bin are cropped
+    assert binned.shape == (255, 255) and binned.dtype == np.float32
+    np.testing.assert_allclose(binned[1, 2], frame[4:8, 8:12].mean(), rtol=1e-6)
+    strided = frames.decimate(frame, FACTOR, binning=False)
+    assert strided.base is frame and strided[1, 2] == frame[4, 8]
+    assert frames.decimate(frame, 1) is frame
+
+
+def test_no_allocation_per_frame():
+    frame = detector_frame()
+    buffer = frames.FrameBuffer()
+    shape = frames.decimated_shape(frame.shape, FACTOR)
+
+    def show_frame():
+        out = frames.decimate(frame, FACTOR, out=buffer.buffer(shape, np.float32))
+        buffer.put(out)
+        buffer.take()
+
+    show_frame()  # allocates the three buffers
+    tracemalloc.start()
+    try:
+        for i in range(100):
+            show_frame()
+        current, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    # Binning into the preallocated buffers never allocates a frame; only NumPy's small reduction buffers show up
+    frame_bytes = np.empty(shape, np.float32).nbytes
+    assert peak < frame_bytes / 2
+    assert current < frame_bytes / 100
+
+
+def test_level_estimator():
+    frame = detector_frame().astype(np.float32)
+    estimator = frames.LevelEstimator(alpha=.5)
+    low, high = estimator.update(frame)
+    assert 0 <= low < 50 and 3950 < high <= 4000
+    # Follows a brighter beam gradually
+    assert estimator.update(frame + 1000)[1] < high + 1000
+    estimator.reset()
+    assert estimator.update(frame + 1000)[1] > 4950
@@ -0,0 +1,70 @@
+import importlib.util
+import json
+import os
+import time
+
+import pytest
+
+pytest.importorskip('appdirs')
+pytest.importorskip('xicam.core.msg')
+
+# journal.py only needs appdirs and xicam.core.msg; load it directly so the test doesn't start the run engine
+_spec = importlib.util.spec_from_file_location(
+    'journal', os.path.join(os.path.dirname(__file__), '..', 'xicam', 'Acquire', 'journal.py'))
+journal = importlib.util.module_from_spec(_spec)
+_spec.loader.exec_module(journal)
+
+N = 100000
+
+
+def test_recover_unfinished(tmp_path):
+    path = str(tmp_path / 'plan_journal.jsonl')
+    plan_journal = journal.PlanJournal(path)
+    for plan_id in 'abcd':
+        plan_journal.queued(plan_id, 1, [plan_id, 'code'])
+    plan_journal.started('a')
+    plan_journal.finished('a')
+    plan_journal.cancelled('b')
+    plan_journal.started('c')
+    plan_journal.reprioritized('d', 0)
+    plan_journal.close()
+
+    assert journal.PlanJournal(path).recover() == [('c', 1, ['c', 'code']), ('d', 0, ['d', 'code'])]
+    # Compacted down to the unfinished plans, which are recovered again until they finish
+    with open(path) as f:
+        assert len(f.readlines()) == 2
+    assert [plan_id for plan_id, _, _ in journal.PlanJournal(path).recover()] == ['c', 'd']
+
+
+def test_torn_and_bad_records(tmp_path):
+    path = str(tmp_path / 'plan_journal.jsonl')
+    with open(path, 'w') as f:
+        f.write(json.dumps({'event': 'queued', 'id': 'a', 'priority': 1, 'plan': ['a']}) + '\n')
+        f.write(json.dumps({'event': 'queued'}) + '\n')
+        f.write('{"event": "finis')
+
+    plan_journal = journal.PlanJournal(path)
+    assert plan_journal.recover() == [('a', 1, ['a'])]
+    # A record that can't be serialized is dropped without stopping the writer
+    plan_journal.queued('b', 1, [object()])
+    plan_journal.queued('c', 1, ['c'])
+    plan_journal.close()
+    assert [plan_id for plan_id, _, _ in journal.PlanJournal(path).recover()] == ['a', 'c']
+
+
+def test_append_rate(tmp_path):
+    path = str(tmp_path / 'plan_journal.jsonl')
+    plan_journal = journal.PlanJournal(path)
+
+    start = time.perf_counter()
+    for i in range(N):
+        plan_journal.queued(str(i), i % 10, [f'plan {i}', 'yield from count([det])', '', ''])
+    recorded = time.perf_counter() - start
+    plan_journal.close()
+    written = time.perf_counter() - start
+
+    # Recording only hands the record to the writer; the disk is never on the caller's path
+    assert N / recorded > 20000
+    # The writer batches records and fsyncs once per batch, rather than once per record
+    assert N / written > 2000
+    assert len(journal.PlanJournal(path).recover()) == N
@@ -0,0 +1,86 @@
+import importlib.util
+import os
+import sys
+import time
+import types
+
+import pytest
+
+pytest.importorskip('appdirs')
+
+# planitem.py only needs appdirs until a plan is run; load it directly so the test doesn't start the run engine
+_spec = importlib.util.spec_from_file_location(
+    'planitem', os.path.join(os.path.dirname(__file__), '..', 'xicam', 'Acquire', 'plans', 'planitem.py'))
+planitem = importlib.util.module_from_spec(_spec)
+_spec.loader.exec_module(planitem)
+
+PLAN = '''import itertools
+from test_planitem_calls import calls
+
+calls.append(len(calls))
+steps = itertools.count()
+
+
+def plan_generator(n):
+    for i in range(n):
+        yield next(steps)
+
+
+plan = plan_generator(3)
+'''
+
+
+@pytest.fixture(autouse=True)
+def plan_cache(tmp_path, monkeypatch):
+    monkeypatch.setattr(planitem, 'plan_cache_dir', str(tmp_path / 'plans'))
+    monkeypatch.setattr(planitem, '_compiled_plans', dict())
+    calls = types.ModuleType('test_planitem_calls')
+    calls.calls = []
+    monkeypatch.setitem(sys.modules, 'test_planitem_calls', calls)
+    return calls.calls
+
+
+def test_each_run_gets_a_new_plan(plan_cache):
+    item = planitem.PlanItem('plan', None, None, PLAN)
+    assert item.parameter is None
+    first = item.make_plan()
+    # The first run takes the plan built when the item was first looked at, without running the code again
+    assert plan_cache == [0]
+    second = item.make_plan()
+    assert plan_cache == [0, 1]
+    assert first is not second
+    # Nothing stateful is shared between runs
+    assert list(first) == list(second) == [0, 1, 2]
+
+
+def test_imports_after_other_code_stay_in_order(tmp_path, monkeypatch):
+    (tmp_path / 'test_planitem_module.py').write_text('value = 42\n')
+    monkeypatch.setattr(sys, 'path', sys.path[:])
+    monkeypatch.delitem(sys.modules, 'test_planitem_module', raising=False)
+    code = (f'import sys\n'
+            f'sys.path.append({str(tmp_path)!r})\n'
+            f'import test_planitem_module\n'
+            f'plan = iter([test_planitem_module.value])\n')
+
+    item = planitem.PlanItem('plan', None, None, code)
+    assert list(item.make_plan()) == [42]
+    assert list(item.make_plan()) == [42]
+
+
+def test_compiled_once(plan_cache, tmp_path):
+    start = time.perf_counter()
+    for i in range(1000):
+        item = planitem.PlanItem('plan', None, None, PLAN)
+        assert list(item.make_plan()) == [0, 1, 2]
+    cached = time.perf_counter() - start
+
+    # One parse for 1000 plans, in memory and on disk
+    assert len(planitem._compiled_plans) == 1
+    assert len(os.listdir(tmp_path / 'plans')) == 1
+    assert len(plan_cache) == 1000
+
+    start = time.perf_counter()
+    for i in range(1000):
+        exec(compile(PLAN, '<plan>', 'exec'), dict())
+    uncached = time.perf_counter() - start
+    assert cached < uncached
@@ -0,0 +1,84 @@
+import importlib.util
+import os
+import random
+import time
+
+# planqueue.py has no dependencies; load it directly so the test doesn't start the run engine or need Xi-cam
+_spec = importlib.util.spec_from_file_location(
+    'planqueue', os.path.join(os.path.dirname(__file__), '..', 'xicam', 'Acquire', 'planqueue.py'))
+planqueue = importlib.util.module_from_spec(_spec)
+_spec.loader.exec_module(planqueue)
+PlanQueue, PrioritizedPlan = planqueue.PlanQueue, planqueue.PrioritizedPlan
+
+N = 100000
+
+
+def take_all(queue):
+    plans = []
+    while True:
+        priority_plan = queue.take(lambda priority_plan: True)
+        if priority_plan is None:
+            return plans
+        plans.append(priority_plan)
+
+
+def test_priority_then_submission_order():
+    random.seed(0)
+    queue = PlanQueue()
+    submitted = [PrioritizedPlan(random.randint(0, 9), ((), {}), name=str(i)) for i in range(N)]
+    for priority_plan in submitted:
+        queue.put(priority_plan)
+    assert len(queue) == N
+
+    taken = take_all(queue)
+
+    # Sorted by priority; equal priorities come out in the order they were submitted
+    expected = sorted(range(N), key=lambda i: (submitted[i].priority, i))
+    assert [priority_plan.name for priority_plan in taken] == [str(i) for i in expected]
+    assert len(queue) == 0
+
+
+def test_cancel_and_reprioritize():
+    random.seed(1)
+    queue = PlanQueue()
+    submitted = [PrioritizedPlan(random.randint(0, 9), ((), {}), name=str(i)) for i in range(N)]
+    for priority_plan in submitted:
+        queue.put(priority_plan)
+
+    cancelled = {priority_plan.id for priority_plan in random.sample(submitted, N // 10)}
+    for plan_id in cancelled:
+        assert queue.cancel(plan_id) is not None
+    remaining = [priority_plan for priority_plan in submitted if priority_plan.id not in cancelled]
+    urgent = remaining[-1]
+    assert queue.reprioritize(urgent.id, -1)
+
+    assert urgent.id in queue
+    assert not any(plan_id in queue for plan_id in cancelled)
+    assert len(queue) == len(remaining)
+
+    taken = take_all(queue)
+    assert taken[0].id == urgent.id
+    assert {priority_plan.id for priority_plan in taken} == {priority_plan.id for priority_plan in remaining}
+    assert [(p.priority, p.sequence) for p in taken[1:]] == sorted((p.priority, p.sequence) for p in taken[1:])
+
+
+def test_skipped_plans_keep_their_place():
+    queue = PlanQueue()
+    plans = [PrioritizedPlan(1, ((), {}), name=str(i)) for i in range(3)]
+    for priority_plan in plans:
+        queue.put(priority_plan)
+
+    # A plan that can't run yet is skipped without losing its place
+    assert queue.take(lambda priority_plan: priority_plan.name != '0') is plans[1]
+    assert queue.take(lambda priority_plan: None) is None
+    assert [priority_plan.name for priority_plan in take_all(queue)] == ['0', '2']
+
+
+def test_throughput():
+    queue = PlanQueue()
+    start = time.perf_counter()
+    for i in range(N):
+        queue.put(PrioritizedPlan(i % 10, ((), {})))
+    assert len(take_all(queue)) == N
+    # Generous bound; O(n log n) comfortably clears it, a linear scan per take would not
+    assert time.perf_counter() - start < 20
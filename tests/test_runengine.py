@@ -0,0 +1,180 @@
+import collections
+import threading
+import time
+
+import pytest
+
+pytest.importorskip('bluesky')
+pytest.importorskip('ophyd')
+pytest.importorskip('qtpy')
+pytest.importorskip('appdirs')
+pytest.importorskip('xicam.core.threads')
+pytest.importorskip('xicam.gui.utils')
+pytest.importorskip('xicam.plugins')
+
+from bluesky import plan_stubs as bps
+from ophyd.sim import motor1, motor2
+from qtpy.QtCore import Qt
+from qtpy.QtWidgets import QApplication
+
+from xicam.Acquire.journal import PlanJournal
+from xicam.Acquire.plans.planitem import PlanItem
+from xicam.Acquire.runengine import QRunEngine
+
+
+class Finished(object):
+    # Counts sigFinish emissions, as they happen in the worker threads
+    def __init__(self, engine):
+        self.count = 0
+        self._condition = threading.Condition()
+        engine.sigFinish.connect(self._finished, Qt.DirectConnection)
+
+    def _finished(self):
+        with self._condition:
+            self.count += 1
+            self._condition.notify_all()
+
+    def wait(self, count, timeout=30):
+        with self._condition:
+            return self._condition.wait_for(lambda: self.count >= count, timeout)
+
+
+def moves(motor, steps=5, delay=.05):
+    for i in range(steps):
+        yield from bps.checkpoint()
+        yield from bps.mv(motor, i)
+        yield from bps.sleep(delay)
+
+
+@pytest.fixture(scope='module')
+def app():
+    return QApplication.instance() or QApplication([])
+
+
+@pytest.fixture
+def engine(app, request):
+    engine = QRunEngine(getattr(request, 'param', 2))
+    yield engine
+    engine.shutdown()
+
+
+def test_shutdown_waits_for_running_plans(engine, tmp_path):
+    path = str(tmp_path / 'plan_journal.jsonl')
+    engine.replay(PlanJournal(path))
+    started = threading.Event()
+    engine.sigStart.connect(started.set, Qt.DirectConnection)
+
+    planitem = PlanItem('sleep', None, None, 'from bluesky.plan_stubs import sleep\nplan = sleep(.5)')
+    engine(planitem.make_plan(), planitem=planitem)
+    assert started.wait(5)
+    engine.shutdown()
+
+    # The plan finished before the journal closed, so it isn't replayed next session
+    assert PlanJournal(path).recover() == []
+
+
+def test_plans_on_disjoint_devices_run_concurrently(engine):
+    N = 8
+    finished = Finished(engine)
+
+    start = time.perf_counter()
+    for i in range(N):
+        motor = (motor1, motor2)[i % 2]
+        engine(moves(motor), devices=[motor])
+    assert finished.wait(N)
+    concurrent = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for i in range(N):
+        engine(moves(motor1), devices=[motor1])
+    assert finished.wait(2 * N)
+    serial = time.perf_counter() - start
+
+    # Two workers; plans on one motor have to take turns
+    assert concurrent < .75 * serial
+
+
+def test_planitem_declares_devices(engine):
+    planitem = PlanItem('moves', None, None, 'from ophyd.sim import motor1\n'
+                                              'from bluesky.plan_stubs import mv\n'
+                                              'plan = mv(motor1, 1)\n'
+                                              'devices = [motor1]')
+    planitem.make_plan()
+    assert planitem.devices == [motor1]
+
+
+@pytest.mark.parametrize('engine', [3], indirect=True)
+def test_pause_resume_stress(engine):
+    N = 8
+    finished = Finished(engine)
+    pauses = []
+    engine.sigPause.connect(lambda: pauses.append(time.monotonic()), Qt.DirectConnection)
+    runs = collections.defaultdict(list)
+
+    def tracked(motor):
+        start = time.monotonic()
+        yield from moves(motor, steps=10, delay=.02)
+        runs[motor.name].append((start, time.monotonic()))
+
+    # Mostly one motor, so an idle worker would take the next plan on it if a paused plan let go of it
+    for i in range(N):
+        motor = motor2 if i % 4 == 3 else motor1
+        engine(tracked(motor), devices=[motor])
+
+    deadline = time.monotonic() + 60
+    while finished.count < N and time.monotonic() < deadline:
+        time.sleep(.03)
+        engine.pause()
+        time.sleep(.03)
+        engine.resume()
+    time.sleep(.5)
+
+    assert pauses
+    # Each plan finished exactly once, however often it was paused and resumed
+    assert finished.count == N
+    assert sum(map(len, runs.values())) == N
+    # Paused plans kept their motor: plans on one motor never overlapped
+    for intervals in runs.values():
+        intervals.sort()
+        assert all(end <= start for (_, end), (start, _) in zip(intervals, intervals[1:]))
+
+
+def test_start_latency(engine):
+    started = threading.Event()
+    engine.sigStart.connect(started.set, Qt.DirectConnection)
+    finished = Finished(engine)
+
+    latencies = []
+    for i in range(50):
+        started.clear()
+        start = time.perf_counter()
+        engine(bps.null())
+        assert started.wait(5)
+        latencies.append(time.perf_counter() - start)
+        assert finished.wait(i + 1)
+
+    # Workers block on the queue and are woken by put(), rather than polling it every 100 ms
+    latencies.sort()
+    assert latencies[len(latencies) // 2] < .01
+
+
+def test_queue_signals(engine):
+    events = []
+    engine.sigPlanQueued.connect(lambda priority_plan: events.append(('queued', priority_plan.id,
+                                                                      priority_plan.priority)), Qt.DirectConnection)
+    engine.sigPlanDequeued.connect(lambda plan_id: events.append(('dequeued', plan_id)), Qt.DirectConnection)
+    started = threading.Event()
+    engine.sigStart.connect(started.set, Qt.DirectConnection)
+    finished = Finished(engine)
+
+    # Nothing overtakes a plan without devices, so the others stay queued until it's done
+    first = engine(bps.sleep(.5))
+    assert started.wait(5)
+    second = engine(bps.null())
+    third = engine(bps.null())
+    assert engine.reprioritize(third, 0)
+    assert engine.cancel(second)
+    assert finished.wait(2)
+
+    assert events == [('queued', first, 1), ('dequeued', first), ('queued', second, 1), ('queued', third, 1),
+                      ('queued', third, 0), ('dequeued', second), ('dequeued', third)]
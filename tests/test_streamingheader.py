@@ -0,0 +1,57 @@
+import pickle
+
+import numpy as np
+import pytest
+
+pytest.importorskip('xicam.core.data')
+pytest.importorskip('xicam.plugins')
+
+from xicam.Acquire.datasources import streamingheader
+from xicam.Acquire.datasources.streamingheader import EventPages, StreamingHeader
+
+FRAME = 2 ** 20  # bytes per event's frame
+
+
+def event(i, nbytes=FRAME):
+    return {'seq_num': i + 1, 'data': {'image': np.full(nbytes, i % 256, np.uint8)}, 'timestamps': {'image': 0.}}
+
+
+def test_page_bounded_by_bytes():
+    pages = EventPages(page_size=1000, page_bytes=10 * FRAME)
+    for i in range(50):
+        pages.extend([event(i)])
+        # Frames, not event counts, decide when a page is spilled
+        assert pages._page_nbytes < 10 * FRAME
+    assert len(pages) == 50
+    assert [doc['seq_num'] for doc in pages] == list(range(1, 51))
+    assert pages[-1]['data']['image'][0] == 49
+    assert [doc['seq_num'] for doc in pages[5:25:5]] == [6, 11, 16, 21]
+
+
+def test_pages_unpickled_once_when_read_in_order(monkeypatch):
+    pages = EventPages(page_size=100)
+    pages.extend(event(i, 16) for i in range(1050))
+    loads = []
+    load = pickle.load
+    monkeypatch.setattr(streamingheader.pickle, 'load', lambda f: loads.append(1) or load(f))
+
+    assert [pages[i]['seq_num'] for i in range(len(pages))] == list(range(1, 1051))
+    assert len(loads) == 10
+
+    pages.clear()
+    assert len(pages) == 0
+    with pytest.raises(IndexError):
+        pages[0]
+
+
+def test_subscribers_see_each_document():
+    header = StreamingHeader()
+    seen = []
+    header.subscribe(lambda doctype, doc: seen.append((doctype, len(header.eventdocs))))
+    header.append('start', {'uid': 'run'})
+    header.append('event', event(0, 16))
+    header.append('stop', {'exit_status': 'success'})
+
+    # Called once the document is in the header
+    assert seen == [('start', 0), ('event', 1), ('stop', 1)]
+    assert header.complete
@@ -11,6 +11,7 @@ from .controlwidgets.deviceview import DeviceView
 from .controlwidgets import RunEngineWidget
 
 from .runengine import RE
+from .journal import PlanJournal
 
 
 class AcquirePlugin(GUIPlugin):
@@ -32,8 +33,13 @@ class AcquirePlugin(GUIPlugin):
                        }
         super(AcquirePlugin, self).__init__()
 
+        # Pick up any plans left in the queue when Xi-cam last exited
+        RE.replay(PlanJournal())
+
 
 class QStackedWidget(QStackedWidget):
     def addSetWidget(self, w):
-        self.addWidget(w)
+        # Device displays are cached and may be shown again
+        if self.indexOf(w) == -1:
+            self.addWidget(w)
         self.setCurrentWidget(w)
@@ -2,8 +2,9 @@ import numpy as np
 import pyqtgraph as pg
 import pyqtgraph.ptime as ptime
 from pyqtgraph import GradientWidget
-from qtpy.QtWidgets import QWidget, QVBoxLayout, QCheckBox, QGroupBox, QFormLayout, QHBoxLayout, QPushButton
+from qtpy.QtWidgets import QWidget, QVBoxLayout, QCheckBox, QGroupBox, QFormLayout, QHBoxLayout, QPushButton, QApplication
 from qtpy.QtCore import QTimer
+from qtpy.QtGui import QTransform
 from xicam.core import threads
 from xicam.plugins import ControllerPlugin
 from functools import partial
@@ -19,6 +20,8 @@ from timeit import default_timer
 from contextlib import contextmanager
 # from xicam.SAXS.processing.correction import CorrectFastCCDImage
 from xicam.Acquire.runengine import RE
+from .frames import FrameBroker, FrameBuffer, LevelEstimator, decimate, decimated_shape
+import threading
 import time
 
 
@@ -31,23 +34,57 @@ class ADImageView(DynImageView,
     pass
 
 
+def _stopUpdater(stop: threading.Event, visible: threading.Event, *_):
+    # Also called when the controller is destroyed, so it only touches the updater's events; a blocked updater sees
+    # them within its one second counter wait at the latest
+    stop.set()
+    visible.set()
+
+
 class AreaDetectorController(ControllerPlugin):
     viewclass = ADImageView
 
-    def __init__(self, device, maxfps=1):
+    def __init__(self, device, maxfps=1, downsample=None):
         super(AreaDetectorController, self).__init__(device)
         self.maxfps = maxfps
+        # Frames are binned by this factor (into the frame buffer's preallocated arrays) before they reach the GUI
+        # thread; None picks the largest factor that still leaves them at least as large as the screen
+        self.downsample = downsample
+        screen = QApplication.primaryScreen().size()
+        self._screen_size = max(screen.width(), screen.height())
+        self._factor = 1
+        self._display_factor = 1
         self._autolevel = True
+        self._frames = FrameBuffer()
+        self._level_estimator = LevelEstimator()
+        self._levels = None
+        # Whether the view transforms frames before display (see _processes); levels are estimated on what is shown
+        self._processing = False
+        self._setting_levels = False
+        self._broker = None
+        self._last_counter = None
+        self._visible = threading.Event()
+        self._stop = threading.Event()
 
         self.setLayout(QVBoxLayout())
 
         self.imageview = self.viewclass()
         self.passive = QCheckBox('Passive Mode')
         self.passive.setChecked(True)
+        self.monitor = QCheckBox('Monitor Mode')
+        self.monitor.setToolTip('Only read a frame from the detector when its array counter changes')
+        self.monitor.setChecked(True)
+        self.autolevels = QCheckBox('Auto Levels')
+        self.autolevels.setChecked(True)
+        self.autolevels.toggled.connect(lambda checked: self._level_estimator.reset())
+        # Adjusting the histogram by hand takes over from Auto Levels
+        self.imageview.ui.histogram.item.sigLevelChangeFinished.connect(self._levelsChanged)
         self.error_text = pg.TextItem('Connecting to device...')
         self.imageview.view.addItem(self.error_text)
         self.layout().addWidget(self.imageview)
         self.layout().addWidget(self.passive)
+        self.layout().addWidget(self.monitor)
+        self.layout().addWidget(self.autolevels)
 
         pvname = device.prefix
       
@@ -85,41 +122,115 @@ class AreaDetectorController(ControllerPlugin):
 
         self.thread = threads.QThreadFutureIterator(self.update,
                                                     showBusy=False,
-                                                    callback_slot=self.setFrame,
+                                                    callback_slot=self.showLatestFrame,
                                                     except_slot=self.setError,
                                                     threadkey=f'device-updater-{self.device.name}')
         self.thread.start()
+        QApplication.instance().aboutToQuit.connect(self.stop)
+        # A controller on a QStackedWidget never gets a closeEvent; stop the updater whenever the widget goes away
+        self.destroyed.connect(partial(_stopUpdater, self._stop, self._visible))
+
+    def showEvent(self, event):
+        super(AreaDetectorController, self).showEvent(event)
+        self._visible.set()
+
+    def hideEvent(self, event):
+        super(AreaDetectorController, self).hideEvent(event)
+        self._visible.clear()
+
+    def closeEvent(self, event):
+        self.stop()
+        super(AreaDetectorController, self).closeEvent(event)
+
+    def stop(self, timeout=2.):
+        # Wake the updater wherever it is blocked so it can see it's been stopped, then wait (at most ``timeout``
+        # seconds) for it to exit; a Channel Access call can keep it longer, and it exits once that returns
+        if self._stop.is_set():
+            return
+        _stopUpdater(self._stop, self._visible)
+        broker = self._broker
+        if broker is not None:
+            broker.wake()
+        if not self.thread.wait(int(timeout * 1000)):
+            msg.logMessage(f'The {self.device.name} frame updater is still busy; it will stop once its current '
+                           f'request returns.', level=msg.WARNING)
 
     def update(self):
+        try:
+            yield from self._update()
+        finally:
+            # The updater owns the broker subscription, so it's dropped however the updater ends
+            if self._broker is not None:
+                self._broker.unsubscribe()
+                self._broker = None
+
+    def _update(self):
 
         while True:
+            # Do nothing unless this widget is visible; the thread sleeps here while off-screen
+            self._visible.wait()
+            if self._stop.is_set():
+                return
+
             try:
                 with msg.busyContext():
                     if not self.device._device_obj:
                         msg.showMessage('Instantiating device...')
                         device = self.device.device_obj  # Force cache the device_obj
 
-                # Do nothing unless this widget is visible
-                if not self.visibleRegion().isEmpty():
-                    # check if the object thinks its staged or is actually not staged
-                    if not self.device.device_obj.trigger_staged or \
-                            self.device.device_obj.image1.array_size.get() == (0,0,0):
-                        msg.showMessage('Staging the device...')
-                        self.device.device_obj.trigger()
+                if self._broker is None:
+                    # Frames come through a broker shared with any other views of this detector; it monitors the
+                    # array counter, which tells us when there's actually a new frame to read
+                    self._broker = FrameBroker.subscribe(self.device)
+                self._broker.connect()
+
+                # check if the object thinks its staged or is actually not staged
+                if not self.device.device_obj.trigger_staged or \
+                        self.device.device_obj.image1.array_size.get() == (0,0,0):
+                    msg.showMessage('Staging the device...')
+                    self.device.device_obj.trigger()
 
-                    yield self.getFrame()
+                frame = self.getFrame()
+                if frame is not None and not self._stop.is_set():
+                    # Decimate here so the GUI thread only ever sees display-sized frames
+                    factor = self._downsampleFactor(frame)
+                    if factor > 1:
+                        out = self._frames.buffer(decimated_shape(frame.shape, factor), np.float32)
+                        frame = decimate(frame, factor, out=out)
+                    self._factor = factor
+                    if self.autolevels.isChecked() and not self._processing:
+                        # Levels are estimated here rather than on the GUI thread, unless the view transforms the
+                        # frame first; then they're estimated on the transformed frame in setFrame
+                        self._levels = self._level_estimator.update(frame)
+                    # Only wake the GUI if it isn't already due to pick up a frame; newer frames replace older
+                    if self._frames.put(frame):
+                        yield
 
             except (RuntimeError, CaprotoTimeoutError, ConnectionTimeoutError) as ex:
+                if self._stop.is_set():
+                    return  # e.g. the widget was deleted while we were reading
                 threads.invoke_in_main_thread(self.error_text.setText, 'An error occurred communicating with this device.')
                 msg.logError(ex)
 
-            time.sleep(1./self.maxfps)
+            # Returns early when stopped, so shutdown doesn't wait out the frame interval
+            self._stop.wait(1. / self.maxfps)
+
+    def _downsampleFactor(self, frame):
+        if frame.ndim != 2:
+            return 1
+        if self.downsample is not None:
+            return self.downsample
+        return max(1, max(frame.shape) // self._screen_size)
 
     def getFrame(self):
         try:
             if not self.passive.isChecked():
                 self.device.device_obj.trigger()
-            data = self.device.device_obj.image1.shaped_image.get()
+            if self.monitor.isChecked():
+                # Skip the (full array) read entirely unless the counter monitor has fired
+                if not self._broker.wait(self._last_counter, timeout=1., stop=self._stop) or self._stop.is_set():
+                    return None
+            self._last_counter, data = self._broker.frame()
             # TODO: apply corrections to display; requires access to flats and darks
             # data = np.squeeze(CorrectFastCCDImage().asfunction(images=data,)['corrected_images'].value)
             return data
@@ -128,21 +239,72 @@ class AreaDetectorController(ControllerPlugin):
             msg.logError(ex)
         return None
 
+    def showLatestFrame(self, *_):
+        image = self._frames.take()
+        if image is not None:
+            if self._factor != self._display_factor:
+                # Binned frames are scaled back up, so coordinates stay in detector pixels
+                self._display_factor = self._factor
+                self.imageview.imageItem.setTransform(QTransform.fromScale(self._factor, self._factor))
+            self.setFrame(image)
+
+    def _processes(self):
+        # Whether the view transforms frames in getProcessedImage, e.g. a log-scaling mixin or normalization
+        view = type(self.imageview)
+        return (view.getProcessedImage is not pg.ImageView.getProcessedImage
+                or view.normalize is not pg.ImageView.normalize
+                or not self.imageview.ui.normOffRadio.isChecked())
+
+    @contextmanager
+    def _settingLevels(self):
+        # Level changes made here aren't the user's; see _levelsChanged
+        self._setting_levels = True
+        try:
+            yield
+        finally:
+            self._setting_levels = False
+
+    def _levelsChanged(self, *_):
+        if not self._setting_levels:
+            self.autolevels.setChecked(False)
+
     def setFrame(self, image, *args, **kwargs):
         if image is not None:
-            self.imageview.imageDisp = None
             self.error_text.setText('')
             self.imageview.image = image
             # self.imageview.updateImage(autoHistogramRange=kwargs['autoLevels'])
-            image = self.imageview.getProcessedImage()
-            if self._autolevel:
-                self.imageview.ui.histogram.setHistogramRange(self.imageview.levelMin, self.imageview.levelMax)
-                self.imageview.autoLevels()
+            processing = self._processes()
+            if processing != self._processing:
+                # Levels of raw and transformed frames don't mix
+                self._processing = processing
+                self._level_estimator.reset()
+                self._levels = None
+            if self._autolevel or processing:
+                # Let the view process the frame (e.g. log scaling) and compute its level range
+                self.imageview.imageDisp = None
+                image = self.imageview.getProcessedImage()
+                if self._autolevel:
+                    self.imageview.ui.histogram.setHistogramRange(self.imageview.levelMin, self.imageview.levelMax)
+                    with self._settingLevels():
+                        self.imageview.autoLevels()
+                if processing and self.autolevels.isChecked():
+                    self._levels = self._level_estimator.update(image)
+            else:
+                # The view would display the frame as-is; skip getProcessedImage so it doesn't copy it, but keep its
+                # level range current from a subsample
+                self.imageview.imageDisp = image
+                step = max(1, int(np.sqrt(image.size / 65536)))
+                sample = image[::step, ::step] if image.ndim >= 2 else image[::step * step]
+                self.imageview.levelMin, self.imageview.levelMax = float(np.nanmin(sample)), float(np.nanmax(sample))
+            if self.autolevels.isChecked() and self._levels is not None:
+                with self._settingLevels():
+                    self.imageview.setLevels(*self._levels)
             self.imageview.imageItem.updateImage(image)
 
             self._autolevel = False
 
-            self.error_text.setText(f'FPS: {1. / (time.time() - self._last_timestamp):.2f}')
+            self.error_text.setText(f'FPS: {1. / (time.time() - self._last_timestamp):.2f} '
+                                    f'(displayed: {self._frames.displayed}, dropped: {self._frames.dropped})')
         self._last_timestamp = time.time()
 
     def setError(self, exception: Exception):
@@ -150,9 +312,4 @@ class AreaDetectorController(ControllerPlugin):
         self.error_text.setText('An error occurred while connecting to this device.')
 
     def acquire(self):
-        RE(count([self.device.device_obj]))
-
-
-# TODO: add visibility checking
-# not widget.visibleRegion().isEmpty():
-#             return True
+        RE(count([self.device.device_obj]), devices=[self.device.device_obj])
@@ -0,0 +1,207 @@
+import threading
+
+import numpy as np
+
+
+class FrameBuffer(object):
+    """
+    Bounded, latest-frame-wins hand-off between a detector reader thread and the GUI thread.
+
+    The reader ``put``s every frame it acquires; the GUI ``take``s only the newest one. Frames that are overwritten
+    before the GUI gets to them are dropped and counted, so a slow display never queues up stale frames.
+
+    Frames are passed by reference. When the reader has to produce a new array (e.g. when binning), it can write into
+    ``buffer(...)`` instead of allocating; three preallocated arrays rotate between the reader (back), the hand-off
+    (pending) and the display (front), so the array on display is never written to.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pool = []
+        self._back = None
+        self._pending = None
+        self._front = None
+        self._has_pending = False
+        self.dropped = 0
+        self.displayed = 0
+
+    def buffer(self, shape, dtype):
+        """
+        Returns a preallocated array of the given shape and dtype that is safe for the reader to write into. Only the
+        reader thread should call this.
+        """
+        shape, dtype = tuple(shape), np.dtype(dtype)
+        if not self._pool or self._pool[0].shape != shape or self._pool[0].dtype != dtype:
+            self._pool = [np.empty(shape, dtype) for _ in range(3)]
+            self._back = self._pool[0]
+        elif not any(self._back is array for array in self._pool):
+            # The back slot is holding a frame we don't own; pick the pool array that isn't pending or displayed
+            self._back = next(array for array in self._pool
+                              if array is not self._pending and array is not self._front)
+        return self._back
+
+    def put(self, frame):
+        """
+        Store a new frame. Returns True if the consumer should be notified, i.e. no hand-off was already pending.
+        """
+        with self._lock:
+            notify = not self._has_pending
+            if self._has_pending:
+                self.dropped += 1
+            if frame is self._back:
+                self._back, self._pending = self._pending, frame
+            else:
+                self._pending = frame
+            self._has_pending = True
+        return notify
+
+    def take(self):
+        """
+        Returns the newest pending frame (or None), discarding any older ones.
+        """
+        with self._lock:
+            if not self._has_pending:
+                return None
+            self._front, self._pending = self._pending, self._front
+            self._has_pending = False
+            self.displayed += 1
+            return self._front
+
+
+def decimated_shape(shape, factor: int):
+    return shape[0] // factor, shape[1] // factor
+
+
+def decimate(image: np.ndarray, factor: int, binning=True, out: np.ndarray = None):
+    """
+    Reduce a 2D frame by an integer factor along both axes, either by averaging factor x factor bins or by
+    striding. Edge rows/columns that don't fill a whole bin are cropped. Striding returns a view; binning writes into
+    ``out`` when given.
+    """
+    if factor <= 1 or image.ndim != 2:
+        return image
+    if not binning:
+        return image[::factor, ::factor]
+    rows, cols = decimated_shape(image.shape, factor)
+    binned = image[:rows * factor, :cols * factor].reshape(rows, factor, cols, factor)
+    return binned.mean(axis=(1, 3), dtype=np.float32, out=out)
+
+
+class LevelEstimator(object):
+    """
+    Streaming estimate of display levels for a live image.
+
+    Each update takes percentiles of a strided subsample of the frame (about ``samples`` pixels, independent of the
+    frame size) and blends them into an exponentially-weighted moving average, so the levels follow the beam
+    without a full-frame pass.
+    """
+
+    def __init__(self, low=0.5, high=99.5, alpha=0.2, samples=65536):
+        self.low = low
+        self.high = high
+        self.alpha = alpha
+        self.samples = samples
+        self.levels = None
+
+    def update(self, image: np.ndarray):
+        step = max(1, int(np.sqrt(image.size / self.samples)))
+        sample = image[::step, ::step] if image.ndim >= 2 else image[::step * step]
+        low, high = np.percentile(sample, (self.low, self.high))
+        if high <= low:
+            high = low + 1
+        if self.levels is None:
+            self.levels = (float(low), float(high))
+        else:
+            a = self.alpha
+            self.levels = (float(a * low + (1 - a) * self.levels[0]), float(a * high + (1 - a) * self.levels[1]))
+        return self.levels
+
+    def reset(self):
+        self.levels = None
+
+
+class FrameBroker(object):
+    """
+    Process-wide, per-prefix source of live detector frames.
+
+    Every view of a detector subscribes to the same broker. The broker monitors ``image1.array_counter`` and reads
+    ``image1.shaped_image`` at most once per counter value, handing the cached frame to every other subscriber.
+    Subscriptions are reference counted; when the last one goes away the monitor is dropped and the cache cleared.
+    Brokers share the frame arrays they hand out, so subscribers must not modify them.
+    """
+    _brokers = {}
+    _lock = threading.Lock()
+
+    def __init__(self, device):
+        self.device = device
+        self.prefix = device.pvname
+        self._refcount = 0
+        self._connect_lock = threading.Lock()
+        self._read_lock = threading.Lock()
+        self._counter_changed = threading.Condition()
+        self._subscription = None
+        self._counter = None
+        self._frame = None
+        self._frame_counter = None
+
+    @classmethod
+    def subscribe(cls, device):
+        with cls._lock:
+            broker = cls._brokers.get(device.pvname)
+            if broker is None:
+                broker = cls._brokers[device.pvname] = cls(device)
+            broker._refcount += 1
+        return broker
+
+    def unsubscribe(self):
+        with FrameBroker._lock:
+            self._refcount -= 1
+            if self._refcount > 0:
+                return
+            del FrameBroker._brokers[self.prefix]
+        with self._connect_lock:
+            if self._subscription is not None:
+                self.device.device_obj.image1.array_counter.unsubscribe(self._subscription)
+                self._subscription = None
+        self._frame = None
+
+    def connect(self):
+        """
+        Start monitoring the array counter; instantiates the device if needed.
+        """
+        with self._connect_lock:
+            if self._subscription is None:
+                self._subscription = self.device.device_obj.image1.array_counter.subscribe(self._counterChanged,
+                                                                                           run=False)
+
+    def _counterChanged(self, value=None, **kwargs):
+        with self._counter_changed:
+            self._counter = value
+            self._counter_changed.notify_all()
+
+    def wait(self, last_counter, timeout=None, stop: threading.Event = None):
+        """
+        Block until the array counter has moved past ``last_counter``, or ``stop`` is set (see ``wake``). Returns
+        False on timeout.
+        """
+        with self._counter_changed:
+            return self._counter_changed.wait_for(lambda: (self._counter is not None and self._counter != last_counter)
+                                                  or (stop is not None and stop.is_set()),
+                                                  timeout)
+
+    def wake(self):
+        # Wake every waiter so it can re-check its stop event
+        with self._counter_changed:
+            self._counter_changed.notify_all()
+
+    def frame(self):
+        """
+        Returns ``(counter, frame)`` for the newest frame, only reading it from the detector if the cached one is
+        stale. Concurrent callers share a single read.
+        """
+        with self._read_lock:
+            counter = self._counter
+            if self._frame is None or counter is None or counter != self._frame_counter:
+                self._frame = self.device.device_obj.image1.shaped_image.get()
+                self._frame_counter = counter
+            return self._frame_counter, self._frame
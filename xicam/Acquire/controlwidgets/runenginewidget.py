@@ -1,12 +1,15 @@
+import bisect
+
 from qtpy.QtWidgets import QWidget, QListView, QPushButton, QSplitter, QVBoxLayout
 from qtpy.QtCore import QItemSelectionModel, Qt
-from qtpy.QtGui import QStandardItemModel
+from qtpy.QtGui import QStandardItemModel, QStandardItem
 from xicam.plugins import manager as pluginmanager
 from pyqtgraph.parametertree import ParameterTree, parameterTypes
 from xicam.gui.widgets.metadataview import MetadataWidget
 from functools import partial
 from xicam.core import threads
 from xicam.Acquire.runengine import RE
+from xicam.Acquire.documents import EventPageBatcher, unpack_event_page
 
 empty_parameter = parameterTypes.GroupParameter(name='No parameters')
 
@@ -32,6 +35,17 @@ class RunEngineWidget(QWidget):
         self.abortbutton = QPushButton('Abort')
         self.abortbutton.setStyleSheet('background-color:red;color:white;font-weight:bold;')
 
+        # Run model; rows are kept in queue order, with their (priority, sequence) sort keys in _queuekeys
+        self.runmodel = QStandardItemModel()
+        self._queueitems = dict()
+        self._queuekeys = []
+        self.runselectionmodel = QItemSelectionModel(self.runmodel)
+        self.queueview = QListView()
+        self.queueview.setModel(self.runmodel)
+        self.queueview.setSelectionModel(self.runselectionmodel)
+        self.runnextbutton = QPushButton('Run Next')
+        self.cancelbutton = QPushButton('Cancel')
+
         # Layout
         self.layout = QVBoxLayout()
         self.layout.setContentsMargins(0, 0, 0, 0)
@@ -48,6 +62,9 @@ class RunEngineWidget(QWidget):
         self.runlayout.addWidget(self.pausebutton)
         self.runlayout.addWidget(self.resumebutton)
         self.runlayout.addWidget(self.abortbutton)
+        self.runlayout.addWidget(self.queueview)
+        self.runlayout.addWidget(self.runnextbutton)
+        self.runlayout.addWidget(self.cancelbutton)
         self.runwidget.setLayout(self.runlayout)
         self.splitter.addWidget(self.runwidget)
         self.splitter.addWidget(self.metadata)
@@ -67,11 +84,14 @@ class RunEngineWidget(QWidget):
         RE.sigFinish.connect(self._finished)
         RE.sigStart.connect(self._started)
         RE.sigAbort.connect(self._aborted)
+        RE.sigPlanQueued.connect(self._planqueued)
+        RE.sigPlanDequeued.connect(self._plandequeued)
+        self.runnextbutton.clicked.connect(self.runnext)
+        self.cancelbutton.clicked.connect(self.cancel)
 
-        # Run model
-        self.runmodel = QStandardItemModel()
-        self.runselectionmodel = QItemSelectionModel(self.runmodel)
         self._current_planitem = None
+        for priority_plan in RE.pending:
+            self._planqueued(priority_plan)
 
     def showPlan(self, current, previous):
         planitem = self.plansmodel.itemFromIndex(current).data(Qt.UserRole)
@@ -82,7 +102,18 @@ class RunEngineWidget(QWidget):
         self.metadata.reset()
         planitem = self.plansmodel.itemFromIndex(self.selectionmodel.currentIndex()).data(Qt.UserRole)
 
-        planitem.run(callback=partial(threads.invoke_in_main_thread, self.metadata.doc_consumer, force_event=True))
+        # Batch events into pages so a fast scan doesn't post one main-thread event per Bluesky event
+        planitem.run(callback=EventPageBatcher(partial(threads.invoke_in_main_thread, self._consume,
+                                                       force_event=True)))
+
+    def _consume(self, name, doc):
+        # The metadata view only understands single events; pages are unpacked here, once they've reached the GUI
+        # thread, so there is still just one main-thread invocation per page
+        if name == 'event_page':
+            for event in unpack_event_page(doc):
+                self.metadata.doc_consumer('event', event)
+        else:
+            self.metadata.doc_consumer(name, doc)
 
     def abort(self):
         RE.abort('Aborted by Xi-cam user.')
@@ -94,6 +125,46 @@ class RunEngineWidget(QWidget):
         RE.resume()
         self.resumebutton.setEnabled(False)
 
+    def _selectedqueueid(self):
+        index = self.runselectionmodel.currentIndex()
+        if not index.isValid():
+            return None
+        return index.data(Qt.UserRole)
+
+    def runnext(self):
+        plan_id = self._selectedqueueid()
+        if plan_id and self._queuekeys:
+            RE.reprioritize(plan_id, self._queuekeys[0][0] - 1)
+
+    def cancel(self):
+        plan_id = self._selectedqueueid()
+        if plan_id:
+            RE.cancel(plan_id)
+
+    def _planqueued(self, priority_plan):
+        # A plan that is already listed was reprioritized; move its row
+        selected = self._selectedqueueid() == priority_plan.id
+        self._plandequeued(priority_plan.id)
+
+        key = (priority_plan.priority, priority_plan.sequence)
+        row = bisect.bisect(self._queuekeys, key)
+        self._queuekeys.insert(row, key)
+        item = QStandardItem(f'{priority_plan.name} (priority {priority_plan.priority})')
+        item.setData(priority_plan.id, Qt.UserRole)
+        item.setEditable(False)
+        self.runmodel.insertRow(row, item)
+        self._queueitems[priority_plan.id] = item
+        if selected:
+            self.runselectionmodel.setCurrentIndex(item.index(), QItemSelectionModel.ClearAndSelect)
+
+    def _plandequeued(self, plan_id):
+        item = self._queueitems.pop(plan_id, None)
+        if item is None:
+            return
+        row = item.row()
+        del self._queuekeys[row]
+        self.runmodel.removeRow(row)
+
     def _resumed(self):
         self.resumebutton.setVisible(False)
         self.resumebutton.setEnabled(True)
@@ -109,6 +180,9 @@ class RunEngineWidget(QWidget):
         self._resumed()
 
     def _finished(self):
+        # Other plans may still be running on another worker
+        if not RE.isIdle:
+            return
         self.abortbutton.setEnabled(False)
         self.pausebutton.setEnabled(False)
 
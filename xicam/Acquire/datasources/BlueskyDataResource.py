@@ -5,6 +5,7 @@ from xicam.plugins import manager as pluginmanager
 from xicam.core.data import NonDBHeader
 from ..runengine import RE
 from ..plans.planitem import PlanItem
+from .streamingheader import StreamingHeader
 from xicam.gui.utils import ParameterDialog
 
 class BlueskyDataResourceModel(QObject):
@@ -60,8 +61,9 @@ class BlueskyDataResourcePlugin(DataResourcePlugin):
         super(BlueskyDataResourcePlugin, self).__init__(flags, **config)
 
     def pull(self, planitem: PlanItem):
-        header = NonDBHeader()
+        # The header is returned right away and fills in as the run's documents arrive
+        header = StreamingHeader()
 
-        planitem.run(lambda doctype, doc: header.append(doctype, doc))
+        planitem.run(header.append)
 
         return header
@@ -9,6 +9,7 @@ from pydm.widgets.enum_combo_box import PyDMEnumComboBox
 from qtpy.QtWidgets import QFormLayout, QDialog
 from xicam.Acquire.runengine import RE
 from xicam.core import msg, threads
+from .streamingheader import StreamingHeader
 
 
 class OphydDataResourceModel(QObject):
@@ -97,15 +98,11 @@ class OphydDataResourcePlugin(DataResourcePlugin):
         # instrument = Detector(pvname, name=pvname, read_attrs=['image1'])
         # instrument.image1.shaped_image.kind = 'normal'
 
-        docs = {'start': [],
-                'descriptor': [],
-                'event': [],
-                'resource': [],
-                'datum': [],
-                'stop': []}
+        # The header is returned right away and fills in as the run's documents arrive
+        header = StreamingHeader()
 
-        RE(count([deviceitem.device_obj]), lambda doctype, doc: docs[doctype].append(doc))
-        return NonDBHeader(docs['start'][0], docs['descriptor'], docs['event'], docs['stop'][0])
+        RE(count([deviceitem.device_obj]), header.append, devices=[deviceitem.device_obj])
+        return header
 
     @threads.method
     def stream_to(self, receiver):
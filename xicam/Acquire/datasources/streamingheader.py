@@ -0,0 +1,157 @@
+import bisect
+import pickle
+import tempfile
+import threading
+
+from xicam.core.data import NonDBHeader
+from ..documents import unpack_event_page
+
+
+class StreamingHeader(NonDBHeader):
+    """
+    A NonDBHeader that is filled document-by-document while a run is in progress.
+
+    Start, descriptor and stop documents are kept in memory. Events are buffered in pages of at most ``page_size``
+    events and about ``page_bytes`` bytes; full pages are pickled to a temporary file, so memory use stays bounded
+    however long the run is and however large its frames. ``eventdocs`` can be read at any time and holds the events
+    received so far; views that ``subscribe`` are called with each document as it's added.
+    """
+
+    def __init__(self, page_size=1000, page_bytes=64 * 2 ** 20):
+        self._events = EventPages(page_size, page_bytes)
+        self._callbacks = []
+        super(StreamingHeader, self).__init__({}, [], [], {})
+
+    def subscribe(self, callback):
+        """
+        Call ``callback(doctype, doc)`` after each document is added to the header, from the thread that adds it.
+        """
+        self._callbacks.append(callback)
+
+    def unsubscribe(self, callback):
+        self._callbacks.remove(callback)
+
+    def append(self, doctype, doc):
+        if doctype == 'start':
+            self.startdoc = doc
+        elif doctype == 'descriptor':
+            self.descriptordocs.append(doc)
+        elif doctype == 'event':
+            self._events.extend([doc])
+        elif doctype == 'event_page':
+            self._events.extend(unpack_event_page(doc))
+        elif doctype == 'stop':
+            self.stopdoc = doc
+        for callback in list(self._callbacks):
+            callback(doctype, doc)
+
+    @property
+    def eventdocs(self):
+        return self._events
+
+    @eventdocs.setter
+    def eventdocs(self, events):
+        self._events.clear()
+        self._events.extend(events)
+
+    @property
+    def complete(self):
+        return bool(self.stopdoc)
+
+    def close(self):
+        self._events.clear()
+
+
+# Nominal in-memory size of an event document besides its arrays
+_event_overhead = 1024
+
+
+def _event_nbytes(event):
+    return _event_overhead + sum(getattr(value, 'nbytes', 0) for value in event.get('data', {}).values())
+
+
+class EventPages(object):
+    """
+    Append-only, thread-safe sequence of event documents that keeps at most one page (``page_size`` events, or about
+    ``page_bytes`` bytes of them) in memory and spills full pages to a temporary file. The last page read back from
+    the file is cached, so reading events in order unpickles each page once.
+    """
+
+    def __init__(self, page_size=1000, page_bytes=64 * 2 ** 20):
+        self.page_size = page_size
+        self.page_bytes = page_bytes
+        self._lock = threading.Lock()
+        self._page = []
+        self._page_nbytes = 0
+        self._spill = None
+        self._page_offsets = []
+        # Index of the first event of each spilled page, and the number of spilled events
+        self._page_starts = []
+        self._spilled = 0
+        self._cached = (None, None)
+
+    def extend(self, events):
+        with self._lock:
+            for event in events:
+                self._page.append(event)
+                self._page_nbytes += _event_nbytes(event)
+                if len(self._page) >= self.page_size or self._page_nbytes >= self.page_bytes:
+                    self._spill_page()
+
+    def _spill_page(self):
+        if self._spill is None:
+            self._spill = tempfile.TemporaryFile()
+        self._spill.seek(0, 2)
+        self._page_offsets.append(self._spill.tell())
+        self._page_starts.append(self._spilled)
+        pickle.dump(self._page, self._spill, protocol=pickle.HIGHEST_PROTOCOL)
+        self._spilled += len(self._page)
+        self._page = []
+        self._page_nbytes = 0
+
+    def _load_page(self, index):
+        # Called with the lock held
+        if index == len(self._page_offsets):
+            return self._page
+        if self._cached[0] != index:
+            self._spill.seek(self._page_offsets[index])
+            self._cached = (index, pickle.load(self._spill))
+        return self._cached[1]
+
+    def clear(self):
+        with self._lock:
+            if self._spill is not None:
+                self._spill.close()
+            self._spill = None
+            self._page = []
+            self._page_nbytes = 0
+            self._page_offsets = []
+            self._page_starts = []
+            self._spilled = 0
+            self._cached = (None, None)
+
+    def __len__(self):
+        with self._lock:
+            return self._spilled + len(self._page)
+
+    def __iter__(self):
+        with self._lock:
+            pages = len(self._page_offsets)
+        for index in range(pages + 1):
+            with self._lock:
+                page = list(self._load_page(index))
+            yield from page
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        with self._lock:
+            length = self._spilled + len(self._page)
+            if index < 0:
+                index += length
+            if not 0 <= index < length:
+                raise IndexError(index)
+            if index >= self._spilled:
+                return self._page[index - self._spilled]
+            page = bisect.bisect_right(self._page_starts, index) - 1
+            return self._load_page(page)[index - self._page_starts[page]]
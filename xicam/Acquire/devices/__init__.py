@@ -5,11 +5,14 @@ from xicam.gui.static import path
 from xicam.gui.widgets.searchlineedit import SearchLineEdit
 from copy import deepcopy
 from collections import namedtuple
+from functools import partial
 
 from xicam.plugins import SettingsPlugin, manager
 from collections import namedtuple
 from xicam.plugins import manager as pluginmanager
+from xicam.core import threads
 from .device import Device
+from .warmup import warmup as warmup_devices
 from .fastccd import FastCCD
 from .areadetector import AreaDetector, PilatusDetector
 
@@ -44,6 +47,19 @@ class DeviceSettingsPlugin(SettingsPlugin):
                                                    self.widget)
         self.restore()
 
+        self._warmup_thread = None
+        self.warmup()
+
+    def warmup(self):
+        """
+        Connect all configured devices in the background, so they are ready when first used
+        """
+        devices = {device.name: partial(getattr, device, 'device_obj') for device in self.devices}
+        self._warmup_thread = threads.QThreadFuture(warmup_devices, devices,
+                                                    threadkey='device-warmup',
+                                                    showBusy=False)
+        self._warmup_thread.start()
+
     def add_device(self):
         """
         Open the device connect dialog
@@ -57,7 +73,8 @@ class DeviceSettingsPlugin(SettingsPlugin):
         Removes a device
         """
         if self.listview.selectedIndexes():
-            self.devicesmodel.removeRow(self.listview.selectedIndexes()[0].row())
+            item = self.devicesmodel.takeRow(self.listview.selectedIndexes()[0].row())[0]
+            item.release()
 
     def _add_device(self, device: Device):
         item = DeviceItem(device)
@@ -200,3 +217,10 @@ class DeviceItem(QStandardItem):
                 raise ImportError(f"The '{controllername}' controller could not be loaded.")
             self._widget = controllerclass(self.device)
         return self._widget
+
+    def release(self):
+        # Close the controller (stopping any updater it runs) and delete it, which also takes it off the controls stack
+        if self._widget is not None:
+            self._widget.close()
+            self._widget.deleteLater()
+            self._widget = None
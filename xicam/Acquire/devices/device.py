@@ -1,3 +1,37 @@
+import threading
+from concurrent.futures import Future
+
+_shared_devices = dict()  # (device_cls, prefix, name) -> Future of the device object
+_shared_devices_lock = threading.Lock()
+
+
+def shared_device(device_cls, prefix, name):
+    """
+    Returns the one ``device_cls(prefix=prefix, name=name)`` for this class, prefix and name, constructing it on first
+    use. The name is part of the key since it determines the data keys in documents.
+
+    Construction is single-flight: concurrent callers wait on the same in-flight construction instead of each
+    creating (and connecting) their own object. If construction fails, the error is raised to every waiting caller
+    and the next call tries again.
+    """
+    key = (device_cls, prefix, name)
+    with _shared_devices_lock:
+        future = _shared_devices.get(key)
+        constructing = future is None
+        if constructing:
+            future = _shared_devices[key] = Future()
+
+    if constructing:
+        try:
+            future.set_result(device_cls(prefix=prefix, name=name))
+        except BaseException as ex:
+            with _shared_devices_lock:
+                del _shared_devices[key]
+            future.set_exception(ex)
+            raise
+    return future.result()
+
+
 class Device(object):
     def __init__(self, name, pvname, controller, device_cls):
         self.name = name
@@ -8,8 +42,8 @@ class Device(object):
 
     @property
     def device_obj(self):
-        if not self._device_obj:
-            self._device_obj = self.device_cls(prefix=self.pvname, name=self.name)
+        if self._device_obj is None:
+            self._device_obj = shared_device(self.device_cls, self.pvname, self.name)
         return self._device_obj
 
     def __reduce__(self):
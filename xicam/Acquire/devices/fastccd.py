@@ -10,9 +10,11 @@ from ophyd.areadetector.plugins import PluginBase, ProcessPlugin
 from ophyd import Component as Cpt
 from ophyd.device import FormattedComponent as FCpt
 from ophyd import AreaDetector
-from ophyd.utils import set_and_wait
-import time as ttime
+from ophyd.status import SubscriptionStatus
 import itertools
+import math
+import operator
+from functools import partial, reduce
 
 from ophyd.sim import NullStatus
 
@@ -169,15 +171,15 @@ class StatsPluginCSX(PluginBase):
 
 
 class StandardCam(SingleTrigger, AreaDetector):
-    stats1 = Cpt(StatsPlugin, 'Stats1:')
-    stats2 = Cpt(StatsPlugin, 'Stats2:')
-    stats3 = Cpt(StatsPlugin, 'Stats3:')
-    stats4 = Cpt(StatsPlugin, 'Stats4:')
-    stats5 = Cpt(StatsPlugin, 'Stats5:')
-    roi1 = Cpt(ROIPlugin, 'ROI1:')
-    roi2 = Cpt(ROIPlugin, 'ROI2:')
-    roi3 = Cpt(ROIPlugin, 'ROI3:')
-    roi4 = Cpt(ROIPlugin, 'ROI4:')
+    stats1 = Cpt(StatsPlugin, 'Stats1:', lazy=True)
+    stats2 = Cpt(StatsPlugin, 'Stats2:', lazy=True)
+    stats3 = Cpt(StatsPlugin, 'Stats3:', lazy=True)
+    stats4 = Cpt(StatsPlugin, 'Stats4:', lazy=True)
+    stats5 = Cpt(StatsPlugin, 'Stats5:', lazy=True)
+    roi1 = Cpt(ROIPlugin, 'ROI1:', lazy=True)
+    roi2 = Cpt(ROIPlugin, 'ROI2:', lazy=True)
+    roi3 = Cpt(ROIPlugin, 'ROI3:', lazy=True)
+    roi4 = Cpt(ROIPlugin, 'ROI4:', lazy=True)
     # proc1 = Cpt(ProcessPlugin, 'Proc1:')
     # trans1 = Cpt(TransformPlugin, 'Trans1:')
 
@@ -240,42 +242,67 @@ class FastCCDPlugin(PluginBase):
 class ProductionCamBase(DetectorBase):
     # # Trying to add useful info..
     cam = Cpt(FCCDCam, "cam1:")
-    stats1 = Cpt(StatsPluginCSX, 'Stats1:')
-    stats2 = Cpt(StatsPluginCSX, 'Stats2:')
-    stats3 = Cpt(StatsPluginCSX, 'Stats3:')
-    stats4 = Cpt(StatsPluginCSX, 'Stats4:')
-    stats5 = Cpt(StatsPluginCSX, 'Stats5:')
-    roi1 = Cpt(ROIPlugin, 'ROI1:')
-    roi2 = Cpt(ROIPlugin, 'ROI2:')
-    roi3 = Cpt(ROIPlugin, 'ROI3:')
-    roi4 = Cpt(ROIPlugin, 'ROI4:')
-    trans1 = Cpt(TransformPlugin, 'Trans1:')
-    proc1 = Cpt(ProcessPlugin, 'Proc1:')
-    over1 = Cpt(OverlayPlugin, 'Over1:')
-    fccd1 = Cpt(FastCCDPlugin, 'FastCCD1:')
+    # The optional plugins are lazy: their PVs only connect when they are first accessed. Staging skips the ones that
+    # haven't been (see _skip_unused_lazy_components), so the live view only connects the eager components
+    stats1 = Cpt(StatsPluginCSX, 'Stats1:', lazy=True)
+    stats2 = Cpt(StatsPluginCSX, 'Stats2:', lazy=True)
+    stats3 = Cpt(StatsPluginCSX, 'Stats3:', lazy=True)
+    stats4 = Cpt(StatsPluginCSX, 'Stats4:', lazy=True)
+    stats5 = Cpt(StatsPluginCSX, 'Stats5:', lazy=True)
+    roi1 = Cpt(ROIPlugin, 'ROI1:', lazy=True)
+    roi2 = Cpt(ROIPlugin, 'ROI2:', lazy=True)
+    roi3 = Cpt(ROIPlugin, 'ROI3:', lazy=True)
+    roi4 = Cpt(ROIPlugin, 'ROI4:', lazy=True)
+    trans1 = Cpt(TransformPlugin, 'Trans1:', lazy=True)
+    proc1 = Cpt(ProcessPlugin, 'Proc1:', lazy=True)
+    over1 = Cpt(OverlayPlugin, 'Over1:', lazy=True)
+    fccd1 = Cpt(FastCCDPlugin, 'FastCCD1:', lazy=True)
     image1 = Cpt(ImagePlugin, 'image1:')
 
+    # Seconds to wait for the camera/plugins to reach the requested state when (un)staging, pausing or resuming
+    state_timeout = 10
+
     # This does nothing, but it's the right place to add code to be run
     # once at instantiation time.
     def __init__(self, *arg, readout_time=0.04, **kwargs):
         self.readout_time = readout_time
         super().__init__(*arg, **kwargs)
 
+    def _idle_status(self):
+        # Completes from the detector_state monitor (immediately, if already idle) instead of polling it
+        def is_idle(*, value, **kwargs):
+            if not isinstance(value, str):
+                value = self.cam.detector_state.enum_strs[value]
+            return value == 'Idle'
+
+        return SubscriptionStatus(self.cam.detector_state, is_idle, timeout=self.state_timeout)
+
     def pause(self):
         self.cam.acquire.put(0)
         super().pause()
 
+    def _skip_unused_lazy_components(self):
+        # Device.(un)stage walks _sub_devices with getattr, which would instantiate (and connect) every lazy plugin;
+        # shadow it with the sub-devices that are eager or already instantiated
+        self._sub_devices = [attr for attr in type(self)._sub_devices
+                             if not self._sig_attrs[attr].lazy or attr in self._signals]
+
+    def unstage(self):
+        self._skip_unused_lazy_components()
+        return super().unstage()
+
     def stage(self):
+        self._skip_unused_lazy_components()
+
         # pop both string and object versions to be paranoid
         self.stage_sigs.pop('cam.acquire', None)
         self.stage_sigs.pop(self.cam.acquire, None)
 
         # we need to take the detector out of acquire mode
         self._original_vals[self.cam.acquire] = self.cam.acquire.get()
-        set_and_wait(self.cam.acquire, 0)
-        # but then watch for when detector state
-        while self.cam.detector_state.get(as_string=True) != 'Idle':
-            ttime.sleep(.01)
+        # but then watch for when detector state goes idle; raises if either takes longer than state_timeout
+        status = self.cam.acquire.set(0, timeout=self.state_timeout) & self._idle_status()
+        status.wait(self.state_timeout)
 
         return super().stage()
 
@@ -293,7 +320,7 @@ class ProductionCamStandard(SingleTrigger, ProductionCamBase):
 
     def pause(self):
         set_val = 0
-        set_and_wait(self.hdf5.capture, set_val)
+        self.hdf5.capture.set(set_val, timeout=self.state_timeout).wait(self.state_timeout)
         # val = self.hdf5.capture.get()
         ## Julien fix to ensure these are set correctly
         # print("pausing FCCD")
@@ -305,7 +332,7 @@ class ProductionCamStandard(SingleTrigger, ProductionCamBase):
 
     def resume(self):
         set_val = 1
-        set_and_wait(self.hdf5.capture, set_val)
+        self.hdf5.capture.set(set_val, timeout=self.state_timeout).wait(self.state_timeout)
         self.hdf5._point_counter = itertools.count()
         # The AD HDF5 plugin bumps its file_number and starts writing into a
         # *new file* because we toggled capturing off and on again.
@@ -334,12 +361,49 @@ class TriggeredCamExposure(Device):
         self._Tc = 0.004
         self._To = 0.0035
         self._readout = 0.080
+        # What was last written to each signal (by name), for as long as its monitor agrees; see _write
+        self._written = dict()
+        self._monitored = set()
         super().__init__(*args, **kwargs)
 
+    @staticmethod
+    def _matches(signal, current, value):
+        # Readbacks of computed timings rarely equal them exactly; use the signal's tolerance, or a tight default
+        try:
+            tolerance = getattr(signal, 'tolerance', None)
+            return math.isclose(current, value, rel_tol=1e-6, abs_tol=tolerance or 1e-12)
+        except TypeError:
+            return current == value
+
+    def _write(self, signal, value):
+        # Skip writes that wouldn't change anything; exposure scans often repeat the same setting. Rather than reading
+        # every PV back (a blocking Channel Access read each), remember what was written and forget it as soon as the
+        # PV's monitor reports something else, e.g. from another client or an IOC restart.
+        if signal.name not in self._monitored:
+            signal.subscribe(partial(self._changed, signal), run=False)
+            self._monitored.add(signal.name)
+        elif signal.name in self._written and self._matches(signal, self._written[signal.name], value):
+            return None
+        self._written[signal.name] = value
+        status = signal.set(value)
+        status.add_callback(partial(self._setDone, signal, value))
+        return status
+
+    def _changed(self, signal, value=None, **kwargs):
+        if signal.name in self._written and not self._matches(signal, value, self._written[signal.name]):
+            self._written.pop(signal.name, None)
+
+    def _setDone(self, signal, value, status):
+        # A write that failed may not have changed the PV
+        if not status.success and self._written.get(signal.name) == value:
+            self._written.pop(signal.name, None)
+
     def set(self, exp):
         # Exposure time = 0
         # Cycle time = 1
 
+        writes = []
+
         if exp[0] is not None:
             Efccd = exp[0] + self._Tc + self._To
             # To = start of FastCCD Exposure
@@ -353,19 +417,21 @@ class TriggeredCamExposure(Device):
             hh = exp[0] + self._To  # MCS Count Gate Stop
 
             # Set delay generator
-            self.parent.dg1.A.set(aa)
-            self.parent.dg1.B.set(bb)
-            self.parent.dg1.C.set(cc)
-            self.parent.dg1.D.set(dd)
-            self.parent.dg1.E.set(ee)
-            self.parent.dg1.F.set(ff)
-            self.parent.dg1.G.set(gg)
-            self.parent.dg1.H.set(hh)
-            self.parent.dg2.A.set(0)
-            self.parent.dg2.B.set(0.0005)
+            writes += [(self.parent.dg1.A, aa),
+                       (self.parent.dg1.B, bb),
+                       (self.parent.dg1.C, cc),
+                       (self.parent.dg1.D, dd),
+                       (self.parent.dg1.E, ee),
+                       (self.parent.dg1.F, ff),
+                       (self.parent.dg1.G, gg),
+                       (self.parent.dg1.H, hh),
+                       (self.parent.dg2.A, 0),
+                       (self.parent.dg2.B, 0.0005)]
 
             # Set AreaDetector
-            self.parent.cam.acquire_time.set(Efccd)
+            writes.append((self.parent.cam.acquire_time, Efccd))
+        else:
+            Efccd = self.parent.cam.acquire_time.get()
 
         # Now do period
         if exp[1] is not None:
@@ -374,12 +440,17 @@ class TriggeredCamExposure(Device):
             else:
                 p = exp[1]
 
-        self.parent.cam.acquire_period.set(p)
+            writes.append((self.parent.cam.acquire_period, p))
 
         if exp[2] is not None:
-            self.parent.cam.num_images.set(exp[2])
-
-        return NullStatus()
+            writes.append((self.parent.cam.num_images, exp[2]))
+
+        # All puts go out back-to-back; the combined status completes once every readback matches
+        statuses = [status for status in (self._write(signal, value) for signal, value in writes)
+                    if status is not None]
+        if not statuses:
+            return NullStatus()
+        return reduce(operator.and_, statuses)
 
     def get(self):
         return None
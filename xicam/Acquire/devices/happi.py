@@ -1,64 +1,264 @@
+import collections
+import hashlib
+import json
+import os
+from functools import partial
 from pathlib import Path
 
-from qtpy.QtCore import Qt, QItemSelection, Signal
+from appdirs import user_cache_dir
+from qtpy.QtCore import Qt, QItemSelection, QModelIndex, Signal
 from qtpy.QtGui import QIcon, QStandardItemModel, QStandardItem
-from qtpy.QtWidgets import QVBoxLayout, QWidget, QTreeView, QAbstractItemView
-from happi import Client, Device, HappiItem, from_container
+from qtpy.QtWidgets import QVBoxLayout, QWidget, QTreeView, QAbstractItemView, QLabel, QPushButton
+from happi import Client, from_container
 from typhos.display import TyphosDeviceDisplay
 
 
+from xicam.core import msg, threads
 from xicam.core.paths import site_config_dir, user_config_dir
 from xicam.plugins import SettingsPlugin
 from xicam.gui import static
+from .warmup import warmup as warmup_devices
 
 
 happi_site_dir = str(Path(site_config_dir) / "happi")
 happi_user_dir = str(Path(user_config_dir) / "happi")
+happi_index_dir = user_cache_dir('xicam/happi')
+
+
+def load_index(db_path):
+    """
+    Returns the sorted ``(name, device_class)`` pairs of the devices in a happi JSON database.
+
+    The index is cached on disk, keyed by the database path and modification time, so it is only rebuilt when the
+    database changes. Building it reads the JSON directly rather than instantiating every happi item.
+    """
+    mtime = os.stat(db_path).st_mtime_ns
+    cache_path = os.path.join(happi_index_dir, hashlib.sha1(db_path.encode()).hexdigest() + '.json')
+    try:
+        with open(cache_path) as f:
+            cached = json.load(f)
+        if cached['path'] == db_path and cached['mtime'] == mtime:
+            return [tuple(entry) for entry in cached['entries']]
+    except (OSError, ValueError, KeyError):
+        pass
+
+    with open(db_path) as f:
+        documents = json.load(f)
+    entries = sorted((document.get('name', key), document.get('device_class', ''))
+                     for key, document in documents.items())
+
+    try:
+        os.makedirs(happi_index_dir, exist_ok=True)
+        with open(cache_path + '.tmp', 'w') as f:
+            json.dump({'path': db_path, 'mtime': mtime, 'entries': entries}, f)
+        os.replace(cache_path + '.tmp', cache_path)
+    except OSError:
+        pass  # the on-disk index is only an optimization
+
+    return entries
+
+
+def _instantiate(client: Client, name: str):
+    # Bypass happi's own (unbounded) cache; the tree view's LRU owns the device's lifetime
+    return from_container(client.find_item(name=name), use_cache=False)
 
 
 class HappiClientTreeView(QTreeView):
     sigShowControl = Signal(QWidget)
-    """Tree view that displays happi clients with any associated devices as their children."""
-    def __init__(self, *args, **kwargs):
+    """
+    Tree view that displays happi clients with any associated devices as their children.
+
+    Selected devices are instantiated in a background thread while a placeholder is shown. The most recently used
+    ``cache_size`` devices and their displays are kept, so re-selecting one is immediate; evicted devices are destroyed
+    (disconnecting their PVs) along with their displays. The device on display is never evicted.
+    """
+    def __init__(self, *args, cache_size=8, **kwargs):
         super(HappiClientTreeView, self).__init__(*args, **kwargs)
 
         self.setHeaderHidden(True)
         self.setEditTriggers(QAbstractItemView.NoEditTriggers)
 
+        self.cache_size = max(1, cache_size)
+        self._cache = collections.OrderedDict()  # (client path, name) -> [device, display (built when first shown)]
+        self._loading = dict()  # (client path, name) -> QThreadFuture instantiating the device
+        self._current = None
+        self._placeholder = QLabel()
+        self._placeholder.setAlignment(Qt.AlignCenter)
+
     def selectionChanged(self, selected: QItemSelection, deselected: QItemSelection) -> None:
         selected_indexes = selected.indexes()
         if not selected_indexes:
             return
-        data = selected_indexes[0].data(Qt.UserRole + 1)
-        if isinstance(data, HappiItem):
-            self._activate(data)
+        # Device rows only hold the device name; the happi item is looked up when it's selected
+        client = selected_indexes[0].parent().data(Qt.UserRole + 1)
+        name = selected_indexes[0].data(Qt.UserRole + 1)
+        if isinstance(client, Client) and isinstance(name, str):
+            self._activate(client, name)
+
+    def _activate(self, client: Client, name: str):
+        key = (client.backend.path, name)
+        self._current = key
+        if key in self._cache:
+            self._show(key)
+            return
+
+        self._placeholder.setText(f'Connecting to {name}...')
+        self.sigShowControl.emit(self._placeholder)
+        if key not in self._loading:
+            self._loading[key] = threads.QThreadFuture(_instantiate, client, name,
+                                                       threadkey=f'happi-device-{key}',
+                                                       showBusy=True,
+                                                       callback_slot=partial(self._deviceReady, key),
+                                                       except_slot=partial(self._deviceFailed, key))
+            self._loading[key].start()
+
+    def warmup(self):
+        """
+        Instantiate and connect, in the background, the devices listed under the expanded clients that aren't cached
+        yet, at most ``cache_size`` of them. They go into the same LRU as selected devices.
+        """
+        model = self.model()
+        factories = dict()
+        keys = dict()  # device name -> cache key
+        for row in range(model.rowCount()):
+            client_index = model.index(row, 0)
+            client = client_index.data(Qt.UserRole + 1)
+            if not isinstance(client, Client) or not self.isExpanded(client_index):
+                continue
+            for child in range(model.rowCount(client_index)):
+                name = model.index(child, 0, client_index).data(Qt.UserRole + 1)
+                key = (client.backend.path, name)
+                if not isinstance(name, str) or name in keys or key in self._cache or key in self._loading:
+                    continue
+                if len(factories) == self.cache_size:
+                    break
+                keys[name] = key
+                factories[name] = partial(_instantiate, client, name)
+
+        if not factories:
+            return
+        warmup_thread = threads.QThreadFuture(warmup_devices, factories,
+                                              threadkey='happi-warmup',
+                                              showBusy=True,
+                                              callback_slot=partial(self._warmedUp, keys),
+                                              except_slot=msg.logError)
+        for key in keys.values():
+            self._loading[key] = warmup_thread
+        warmup_thread.start()
+
+    def _warmedUp(self, keys, connected):
+        for name, key in keys.items():
+            if name in connected:
+                self._deviceReady(key, connected[name][0])
+            else:
+                self._loading.pop(key, None)
+                if key == self._current:
+                    self._placeholder.setText(f'Could not connect to {name}. See the Xi-CAM log for details.')
+
+    def _show(self, key):
+        entry = self._cache[key]
+        self._cache.move_to_end(key)
+        if entry[1] is None:
+            # Widgets have to be built on the GUI thread
+            entry[1] = TyphosDeviceDisplay.from_device(entry[0])
+        self.sigShowControl.emit(entry[1])
+
+    def _deviceReady(self, key, device):
+        self._loading.pop(key, None)
+        self._cache[key] = [device, None]
+        if key == self._current:
+            self._show(key)
+        self._evict()
 
-    def _activate(self, item: HappiItem):
-        device = from_container(item)
-        display = TyphosDeviceDisplay.from_device(device)
-        self.sigShowControl.emit(display)
+    def _evict(self):
+        # Drop the least recently used devices, but never the one on display (a late result may be the newest entry)
+        for key in list(self._cache):
+            if len(self._cache) <= self.cache_size:
+                break
+            if key == self._current:
+                continue
+            device, display = self._cache.pop(key)
+            device.destroy()
+            if display is not None:
+                display.deleteLater()
+
+    def _deviceFailed(self, key, ex):
+        self._loading.pop(key, None)
+        msg.logError(ex)
+        if key == self._current:
+            self._placeholder.setText(f'Could not connect to {key[1]}. See the Xi-CAM log for details.')
 
 
 
 class HappiClientModel(QStandardItemModel):
-    """Qt standard model that stores happi clients."""
+    """
+    Qt standard model that stores happi clients.
+
+    Clients are populated lazily: a client's device index is loaded in a background thread the first time it is
+    expanded, and its rows are then added ``batch_size`` at a time as the view scrolls (canFetchMore/fetchMore).
+    """
+    batch_size = 200
+
     def __init__(self, *args, **kwargs):
         super(HappiClientModel, self).__init__(*args, **kwargs)
         self._clients = []
+        self._indexes = dict()  # client path -> index entries, once loaded
+        self._loading = dict()  # client path -> QThreadFuture loading its index
 
     def add_client(self, client: Client):
-        self._clients += client
+        self._clients.append(client)
         client_item = QStandardItem(client.backend.path)
         client_item.setData(client)
+        # Placeholder, so the client shows as expandable until its devices are loaded
+        client_item.appendRow(QStandardItem('Loading...'))
         self.appendRow(client_item)
-        for result in client.search():
-            self.add_device(client_item, result.item)
 
-    def add_device(self, client_item: QStandardItem, device: Device):
-        device_item = QStandardItem(device.name)
-        device_item.setData(device)
+    def add_device(self, client_item: QStandardItem, name: str, device_class: str = ''):
+        device_item = QStandardItem(name)
+        device_item.setData(name)
+        device_item.setToolTip(device_class)
         client_item.appendRow(device_item)
 
+    def _client_item(self, parent: QModelIndex):
+        item = self.itemFromIndex(parent) if parent.isValid() else None
+        if item is not None and isinstance(item.data(), Client):
+            return item
+        return None
+
+    def canFetchMore(self, parent: QModelIndex) -> bool:
+        client_item = self._client_item(parent)
+        if client_item is None:
+            return False
+        entries = self._indexes.get(client_item.data().backend.path)
+        return entries is None or client_item.rowCount() < len(entries)
+
+    def fetchMore(self, parent: QModelIndex) -> None:
+        client_item = self._client_item(parent)
+        if client_item is None:
+            return
+        path = client_item.data().backend.path
+        entries = self._indexes.get(path)
+        if entries is None:
+            if path not in self._loading:
+                self._loading[path] = threads.QThreadFuture(load_index, path,
+                                                            threadkey=f'happi-index-{path}',
+                                                            showBusy=False,
+                                                            callback_slot=partial(self._indexLoaded, client_item),
+                                                            except_slot=msg.logError)
+                self._loading[path].start()
+            return
+
+        start = client_item.rowCount()
+        for name, device_class in entries[start:start + self.batch_size]:
+            self.add_device(client_item, name, device_class)
+
+    def _indexLoaded(self, client_item: QStandardItem, entries):
+        path = client_item.data().backend.path
+        self._loading.pop(path, None)
+        self._indexes[path] = entries
+        client_item.removeRows(0, client_item.rowCount())  # the placeholder
+        self.fetchMore(client_item.index())
+
 
 class HappiSettingsPlugin(SettingsPlugin):
     def __init__(self):
@@ -71,9 +271,13 @@ class HappiSettingsPlugin(SettingsPlugin):
                 client = Client(path=str(db_file))
                 self._client_model.add_client(client)
 
+        warmup_button = QPushButton('Connect listed devices')
+        warmup_button.clicked.connect(self.warmup)
+
         widget = QWidget()
         layout = QVBoxLayout()
         layout.addWidget(self._device_view)
+        layout.addWidget(warmup_button)
         widget.setLayout(layout)
 
         icon = QIcon(str(static.path('icons/calibrate.png')))
@@ -81,6 +285,12 @@ class HappiSettingsPlugin(SettingsPlugin):
         super(HappiSettingsPlugin, self).__init__(icon, name, widget)
         self.restore()
 
+    def warmup(self):
+        """
+        Connect the devices listed under the expanded clients in the background, into the device view's cache
+        """
+        self._device_view.warmup()
+
     @property
     def devices_model(self):
         return self._client_model
@@ -0,0 +1,39 @@
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from xicam.core import msg
+
+
+def _connect(factory, timeout):
+    start = time.monotonic()
+    device = factory()
+    device.wait_for_connection(timeout=timeout)
+    return device, time.monotonic() - start
+
+
+def warmup(devices: dict, max_workers=8, timeout=10.):
+    """
+    Connect devices in parallel, so their channel access connections are already up when they are first used.
+
+    ``devices`` maps a name to a callable returning the (ophyd) device; at most ``max_workers`` devices are
+    instantiated and connected at a time. Each device's connect time is logged, and ``{name: (device, seconds)}`` of
+    those that connected within ``timeout`` is returned. Failures are logged and otherwise ignored.
+    """
+    connected = dict()
+    if not devices:
+        return connected
+
+    start = time.monotonic()
+    with ThreadPoolExecutor(max_workers, thread_name_prefix='device-warmup') as executor:
+        futures = {executor.submit(_connect, factory, timeout): name for name, factory in devices.items()}
+        for future in as_completed(futures):
+            name = futures[future]
+            try:
+                connected[name] = future.result()
+            except Exception as ex:
+                msg.logMessage(f'Could not connect {name} during warm-up:', ex)
+            else:
+                msg.logMessage(f'Connected {name} in {connected[name][1]:.3f} s')
+
+    msg.logMessage(f'Connected {len(connected)} of {len(devices)} devices in {time.monotonic() - start:.3f} s')
+    return connected
@@ -0,0 +1,176 @@
+import logging
+import reprlib
+import threading
+import time
+
+import numpy as np
+from xicam.core import msg
+
+
+class EventPageBatcher(object):
+    """
+    Document callback that packs consecutive events into ``event_page`` documents with NumPy columns before handing
+    them to ``callback``.
+
+    A page is flushed when it reaches ``max_events`` events or ``max_latency`` seconds after its first event,
+    whichever comes first; any other document flushes pending events first, so document order is preserved. Fast
+    scans then produce tens of callbacks per second instead of one per event. Latency flushes come from one flusher
+    thread per batcher, which exits after each run's stop document.
+    """
+
+    def __init__(self, callback, max_events=500, max_latency=.05):
+        self.callback = callback
+        self.max_events = max_events
+        self.max_latency = max_latency
+        self._condition = threading.Condition(threading.RLock())
+        self._events = dict()  # descriptor uid -> pending events
+        self._deadline = None  # when the oldest pending event must be flushed
+        self._flusher = None
+        self._stopped = False
+
+    def __call__(self, name, doc):
+        with self._condition:
+            if name == 'event':
+                events = self._events.setdefault(doc['descriptor'], [])
+                events.append(doc)
+                if len(events) >= self.max_events:
+                    self.callback('event_page', pack_event_page(self._events.pop(doc['descriptor'])))
+                elif self._deadline is None:
+                    self._deadline = time.monotonic() + self.max_latency
+                    if self._flusher is None:
+                        self._flusher = threading.Thread(target=self._flushOnDeadline, daemon=True)
+                        self._flusher.start()
+                    self._condition.notify()
+            else:
+                self.flush()
+                self.callback(name, doc)
+                if name == 'start':
+                    self._stopped = False
+                elif name == 'stop':
+                    self._stopped = True
+                    self._condition.notify()
+
+    def _flushOnDeadline(self):
+        with self._condition:
+            while not self._stopped:
+                if self._deadline is None:
+                    self._condition.wait()
+                    continue
+                remaining = self._deadline - time.monotonic()
+                if remaining > 0:
+                    self._condition.wait(remaining)
+                else:
+                    self.flush()
+            self._flusher = None
+
+    def flush(self):
+        with self._condition:
+            self._deadline = None
+            events, self._events = self._events, dict()
+            for page in events.values():
+                self.callback('event_page', pack_event_page(page))
+
+
+def _column(values):
+    try:
+        return np.asarray(values)
+    except ValueError:  # ragged
+        return list(values)
+
+
+def pack_event_page(events):
+    """
+    Pack a list of events sharing a descriptor into an event_page, with the seq_num, time, data and timestamps
+    columns as NumPy arrays.
+    """
+    keys = events[0]['data'].keys()
+    return {'descriptor': events[0]['descriptor'],
+            'uid': [event['uid'] for event in events],
+            'seq_num': np.asarray([event['seq_num'] for event in events]),
+            'time': np.asarray([event['time'] for event in events]),
+            'data': {key: _column([event['data'][key] for event in events]) for key in keys},
+            'timestamps': {key: _column([event['timestamps'][key] for event in events]) for key in keys},
+            'filled': {key: [event['filled'].get(key) for event in events]
+                       for key in events[0].get('filled', {})}}
+
+
+def unpack_event_page(page):
+    for i, uid in enumerate(page['uid']):
+        yield {'descriptor': page['descriptor'],
+               'uid': uid,
+               'seq_num': page['seq_num'][i],
+               'time': page['time'][i],
+               'data': {key: values[i] for key, values in page['data'].items()},
+               'timestamps': {key: values[i] for key, values in page['timestamps'].items()},
+               'filled': {key: values[i] for key, values in page.get('filled', {}).items()}}
+
+
+class DocumentLogger(object):
+    """
+    Document callback that logs run documents without paying for it when nothing would record them.
+
+    Each document type logs at its own level (``None`` disables it). The level is checked before any formatting, and
+    documents are logged as a summary: arrays are reduced to their shape and dtype, and long containers and strings
+    are abbreviated, with the whole message capped at ``maxlength`` characters.
+    """
+
+    default_levels = {'start': msg.DEBUG,
+                      'descriptor': msg.DEBUG,
+                      'event': msg.DEBUG,
+                      'event_page': msg.DEBUG,
+                      'resource': msg.DEBUG,
+                      'datum': msg.DEBUG,
+                      'stop': msg.DEBUG}
+
+    def __init__(self, levels: dict = None, maxlength=1000):
+        self.levels = dict(self.default_levels, **(levels or {}))
+        self.maxlength = maxlength
+        self._repr = reprlib.Repr()
+        self._repr.maxstring = 80
+        self._repr.maxother = 80
+
+    @staticmethod
+    def isEnabledFor(level, logger=None):
+        """
+        Whether a message at ``level`` would be recorded by ``logger`` (by default the root logger, which is where
+        msg.logMessage logs) or by a handler of one of its ancestors it propagates to.
+        """
+        if logger is None:
+            logger = logging.getLogger()
+        if not logger.isEnabledFor(level):
+            return False
+        handled = False
+        while logger is not None:
+            for handler in logger.handlers:
+                handled = True
+                # msg.logMessage sets its own handler to each message's level before logging the message
+                if handler is msg.stdch or level >= handler.level:
+                    return True
+            if not logger.propagate:
+                break
+            logger = logger.parent
+        return not handled and logging.lastResort is not None and level >= logging.lastResort.level
+
+    def __call__(self, name, doc):
+        level = self.levels.get(name)
+        if level is None or not self.isEnabledFor(level):
+            return
+        text = self._repr.repr(summarize(doc))
+        if len(text) > self.maxlength:
+            text = text[:self.maxlength - 3] + '...'
+        msg.logMessage(name, text, level=level)
+
+
+def summarize(value, maxitems=10):
+    """
+    Replace arrays and long lists in a (nested) document with a short description, without walking their contents.
+    """
+    if isinstance(value, np.ndarray):
+        return f'<ndarray shape={value.shape} dtype={value.dtype}>'
+    if isinstance(value, dict):
+        return {key: summarize(item, maxitems) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        if len(value) > maxitems:
+            return f'<{type(value).__name__} len={len(value)}>'
+        return type(value)(summarize(item, maxitems) for item in value)
+    return value
@@ -0,0 +1,119 @@
+import json
+import os
+import queue
+import threading
+
+from appdirs import user_data_dir
+from xicam.core import msg
+
+journal_path = os.path.join(user_data_dir('xicam'), 'plan_journal.jsonl')
+
+
+class PlanJournal(object):
+    """
+    Append-only on-disk journal of queued, started and finished plans, so pending plans survive a crash.
+
+    Records are handed to a writer thread, which appends whatever has accumulated as one batch and fsyncs once per
+    batch; recording never blocks on disk. Only plans that can be rebuilt (from ``PlanItem.__reduce__`` data) are
+    journaled.
+    """
+
+    def __init__(self, path=journal_path):
+        self.path = path
+        self._records = queue.SimpleQueue()
+        self._file = None
+        self._writer = threading.Thread(target=self._write, name='plan-journal', daemon=True)
+        self._writer.start()
+
+    def queued(self, plan_id, priority, plan_args):
+        self._records.put({'event': 'queued', 'id': plan_id, 'priority': priority, 'plan': list(plan_args)})
+
+    def started(self, plan_id):
+        self._records.put({'event': 'started', 'id': plan_id})
+
+    def finished(self, plan_id):
+        self._records.put({'event': 'finished', 'id': plan_id})
+
+    def cancelled(self, plan_id):
+        self._records.put({'event': 'cancelled', 'id': plan_id})
+
+    def reprioritized(self, plan_id, priority):
+        self._records.put({'event': 'reprioritized', 'id': plan_id, 'priority': priority})
+
+    def close(self):
+        # Write out anything pending and stop the writer
+        self._records.put(None)
+        self._writer.join()
+
+    def _write(self):
+        while True:
+            batch = [self._records.get()]
+            while True:
+                try:
+                    batch.append(self._records.get_nowait())
+                except queue.Empty:
+                    break
+
+            closing = None in batch
+            lines = []
+            for record in batch:
+                if record is None:
+                    continue
+                try:
+                    lines.append(json.dumps(record) + '\n')
+                except (TypeError, ValueError) as ex:
+                    # Drop the record rather than the writer; the plan just won't be recoverable
+                    msg.logError(ex)
+            lines = ''.join(lines)
+            if lines:
+                try:
+                    if self._file is None:
+                        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+                        self._file = open(self.path, 'a')
+                    self._file.write(lines)
+                    self._file.flush()
+                    os.fsync(self._file.fileno())
+                except OSError as ex:
+                    # Keep running plans even if the journal can't be written
+                    msg.logError(ex)
+
+            if closing:
+                if self._file is not None:
+                    self._file.close()
+                    self._file = None
+                return
+
+    def recover(self):
+        """
+        Returns the ``(plan_id, priority, plan_args)`` of every plan that was queued but never finished or cancelled,
+        in submission order, and compacts the journal down to those plans. Call before recording anything new.
+        """
+        unfinished = dict()
+        try:
+            with open(self.path) as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                        if record['event'] == 'queued':
+                            unfinished[record['id']] = record
+                        elif record['event'] == 'reprioritized' and record['id'] in unfinished:
+                            unfinished[record['id']]['priority'] = record['priority']
+                        elif record['event'] in ('finished', 'cancelled'):
+                            unfinished.pop(record['id'], None)
+                    except (ValueError, KeyError, TypeError):
+                        continue  # torn final line from a crash, or a record we don't understand
+        except OSError:
+            return []
+
+        try:
+            with open(self.path + '.tmp', 'w') as f:
+                for record in unfinished.values():
+                    f.write(json.dumps(record) + '\n')
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(self.path + '.tmp', self.path)
+        except OSError as ex:
+            # Compaction is only housekeeping; the journal is still valid uncompacted
+            msg.logError(ex)
+
+        return [(record['id'], record['priority'], record['plan']) for record in unfinished.values()]
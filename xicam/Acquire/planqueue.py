@@ -0,0 +1,91 @@
+import dataclasses
+import heapq
+import itertools
+import uuid
+from dataclasses import dataclass, field
+from typing import Any
+
+
+_sequence = itertools.count()
+
+
+@dataclass(order=True)
+class PrioritizedPlan:
+    priority: int
+    args: Any = field(compare=False)
+    # The (root) devices the plan uses; None means it may use anything and must run alone
+    devices: Any = field(compare=False, default=None)
+    name: str = field(compare=False, default='')
+    id: str = field(compare=False, default_factory=lambda: uuid.uuid4().hex)
+    # Breaks ties between equal priorities so plans come out in the order they were submitted
+    sequence: int = field(default_factory=lambda: next(_sequence))
+    cancelled: bool = field(compare=False, default=False)
+    # Whether the plan is recorded in the journal (i.e. came from a PlanItem)
+    journaled: bool = field(compare=False, default=False)
+
+
+class PlanQueue(object):
+    """
+    Priority queue of PrioritizedPlans indexed by plan id.
+
+    Insertion, reprioritization and cancellation are O(log n): cancelled entries are only flagged and are skipped
+    when they reach the top of the heap. Not thread-safe; QRunEngine guards it with its condition.
+    """
+
+    def __init__(self):
+        self._heap = []
+        self._entries = dict()
+
+    def put(self, priority_plan: PrioritizedPlan):
+        self._entries[priority_plan.id] = priority_plan
+        heapq.heappush(self._heap, priority_plan)
+
+    def cancel(self, plan_id):
+        priority_plan = self._entries.pop(plan_id, None)
+        if priority_plan is None:
+            return None
+        priority_plan.cancelled = True
+        return priority_plan
+
+    def reprioritize(self, plan_id, priority):
+        # Returns the plan's new entry, or None if it isn't queued
+        priority_plan = self.cancel(plan_id)
+        if priority_plan is None:
+            return None
+        priority_plan = dataclasses.replace(priority_plan, priority=priority, cancelled=False)
+        self.put(priority_plan)
+        return priority_plan
+
+    def take(self, runnable):
+        """
+        Remove and return the first plan in priority order for which ``runnable(plan)`` is True. Plans for which it
+        is False are skipped; None stops the search.
+        """
+        skipped = []
+        found = None
+        while self._heap:
+            priority_plan = heapq.heappop(self._heap)
+            if priority_plan.cancelled:
+                continue
+            verdict = runnable(priority_plan)
+            if verdict:
+                found = priority_plan
+                break
+            skipped.append(priority_plan)
+            if verdict is None:
+                break
+        for priority_plan in skipped:
+            heapq.heappush(self._heap, priority_plan)
+        if found is not None:
+            del self._entries[found.id]
+        return found
+
+    def __contains__(self, plan_id):
+        return plan_id in self._entries
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __iter__(self):
+        # Snapshot of the pending plans in priority order
+        return iter(sorted(self._entries.values()))
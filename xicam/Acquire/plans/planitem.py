@@ -1,7 +1,64 @@
 from appdirs import user_cache_dir
+import ast
+import hashlib
 import importlib.util
+import marshal
 import os
-from ..runengine import RE
+
+plan_cache_dir = user_cache_dir('xicam/plans')
+_compiled_plans = dict()
+# Part of the cache key; bump when the way plans are split into setup and body changes
+_compile_version = b'leading-imports:'
+
+
+def _compile(code: str):
+    # The imports the code starts with only need to run once; everything from the first other statement on is re-run
+    # whenever a new plan object is needed, so nothing stateful (generators, subscriptions, ...) is shared between
+    # runs. Later imports stay where they are, since they may depend on what runs before them (sys.path, ...).
+    tree = ast.parse(code, '<plan>')
+    leading = 0
+    while leading < len(tree.body) and isinstance(tree.body[leading], (ast.Import, ast.ImportFrom)):
+        leading += 1
+    setup = ast.Module(body=tree.body[:leading], type_ignores=[])
+    body = ast.Module(body=tree.body[leading:], type_ignores=[])
+    return compile(setup, '<plan>', 'exec'), compile(body, '<plan>', 'exec')
+
+
+def compile_plan(code: str):
+    """
+    Compile plan source to a pair of code objects: the leading imports, which run once, and the code that (re)creates
+    "plan". The bytecode is cached in memory and on disk under ``plan_cache_dir``, keyed by a hash of the source, so
+    each plan is only parsed and validated once.
+    """
+    key = hashlib.sha1(_compile_version + code.encode()).hexdigest()
+    if key in _compiled_plans:
+        return _compiled_plans[key]
+
+    path = os.path.join(plan_cache_dir, f'{key}.pyc')
+    compiled = None
+    try:
+        with open(path, 'rb') as f:
+            # bytecode is only valid for the interpreter that wrote it
+            if f.read(len(importlib.util.MAGIC_NUMBER)) == importlib.util.MAGIC_NUMBER:
+                compiled = marshal.load(f)
+        if not isinstance(compiled, tuple):
+            compiled = None
+    except (OSError, EOFError, ValueError, TypeError):
+        pass
+
+    if compiled is None:
+        compiled = _compile(code)
+        try:
+            os.makedirs(plan_cache_dir, exist_ok=True)
+            with open(path + '.tmp', 'wb') as f:
+                f.write(importlib.util.MAGIC_NUMBER)
+                marshal.dump(compiled, f)
+            os.replace(path + '.tmp', path)
+        except OSError:
+            pass  # the on-disk cache is only an optimization
+
+    _compiled_plans[key] = compiled
+    return compiled
 
 
 class PlanItem(object):
@@ -11,18 +68,52 @@ class PlanItem(object):
         self.params = params
         self.code = code
         self._plan = plan
+        # Whether _plan was built from the code and hasn't been handed out by make_plan yet
+        self._unused = False
+        self._namespace = None
+        # The devices the plan uses, if its code declares them; see _execute
+        self.devices = None
 
     @property
     def plan(self):
         if self._plan is None and self.code:
+            self._plan = self._execute()
+            self._unused = True
+        return self._plan
 
-            exec_locals = dict()
+    def _execute(self):
+        # Run the code in a copy of the (once-imported) setup namespace and return what it assigns to "plan"
+        setup, body = compile_plan(self.code)
+        if self._namespace is None:
+            namespace = dict()
+            exec(setup, namespace)
+            self._namespace = namespace
 
-            # the code is expected to set "plan" to a plan
-            exec(self.code, exec_locals)
+        exec_locals = dict(self._namespace)
 
-            self._plan = exec_locals['plan']
-        return self._plan
+        # the code is expected to set "plan" to a plan, and may set "devices" to the devices it uses, so plans on
+        # other devices can run alongside it
+        exec(body, exec_locals)
+        self.devices = exec_locals.get('devices')
+
+        return exec_locals['plan']
+
+    def make_plan(self):
+        """
+        Returns a new plan to run. A reusable plan object (a callable, e.g. a ParameterizedPlan) is kept and called
+        for each run, so values edited in its parameter tree apply. Anything else, e.g. a generator, which can only be
+        consumed once, is rebuilt by re-running the code.
+        """
+        plan = self.plan
+        if callable(plan):
+            return plan()
+        if not self.code:
+            return plan
+        if self._unused:
+            # The first run can have the plan the code just built, rather than running the code again
+            self._unused = False
+            return plan
+        return self._execute()
 
     @property
     def parameter(self):
@@ -32,4 +123,8 @@ class PlanItem(object):
         return PlanItem, (self.name, self.icon, self.params, self.code)
 
     def run(self, callback=None):
-        RE(self.plan, callback)
+        from ..runengine import RE
+
+        # Each run gets its own plan; see make_plan
+        plan = self.make_plan()
+        RE(plan, callback, planitem=self, devices=self.devices)
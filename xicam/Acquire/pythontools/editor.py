@@ -35,9 +35,9 @@ class scripteditortoolbar(QToolBar):
         if not script: script = self.editor.toPlainText()
 
         planitem = PlanItem('Temp', '', '', script)
-        plan = planitem.plan
+        plan = planitem.make_plan()
 
-        RE.put(plan)
+        RE.put(plan, devices=planitem.devices)
 
 
         # tmpdir = user_config_dir('xicam/tmp')
@@ -130,6 +130,9 @@ plan = scan([det4],
             motor2, min2, max2,
             steps)
 
+# Optional: the devices the plan uses, so plans on other devices can run alongside it
+devices = [det4, motor1, motor2]
+
 ''')
 
     def cleanup(self):
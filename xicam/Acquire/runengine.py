@@ -1,16 +1,19 @@
+import collections
+import threading
 import time
-from queue import PriorityQueue, Empty
-from dataclasses import dataclass, field
-from typing import Any
 from xicam.core import msg, threads
 from xicam.gui.utils import ParameterizedPlan, ParameterDialog
 from functools import partial
 from bluesky import RunEngine, Msg
+from bluesky.utils import RunEngineInterrupted
 import asyncio
 from qtpy import QtCore
 from qtpy.QtCore import QObject, Signal
+from qtpy.QtWidgets import QApplication
 from bluesky.preprocessors import subs_wrapper
 import traceback
+from .documents import DocumentLogger
+from .planqueue import PlanQueue, PrioritizedPlan
 
 
 def _get_asyncio_queue(loop):
@@ -43,13 +46,25 @@ def _get_asyncio_queue(loop):
     return AsyncioQueue
 
 
-@dataclass(order=True)
-class PrioritizedPlan:
-    priority: int
-    args: Any = field(compare=False)
+# Returned by the scheduler to stop a worker thread
+_SHUTDOWN = object()
+
+# Commands a worker executes in its own thread, on the RunEngine it owns
+_RESUME = 'resume'
+_ABORT = 'abort'
 
 
 class QRunEngine(QObject):
+    """
+    Runs queued plans on a pool of RunEngines.
+
+    Plans submitted with ``devices`` only lock those devices, so plans touching disjoint hardware run concurrently on
+    separate workers. Plans without ``devices`` run alone, and nothing queued behind them may overtake them.
+
+    Each RunEngine is driven by exactly one worker thread. New plans and resume/abort commands reach a worker through
+    the same condition, so a paused plan is resumed in the thread that started it, keeps its devices locked while
+    paused, and emits sigFinish once when it is really done.
+    """
     sigDocumentYield = Signal(str, dict)
     sigAbort = Signal()  # TODO: wireup me
     sigException = Signal(Exception)
@@ -57,62 +72,189 @@ class QRunEngine(QObject):
     sigStart = Signal()
     sigPause = Signal()
     sigResume = Signal()
+    # A plan was queued, or queued again with a new priority (PrioritizedPlan); a plan left the queue (plan id)
+    sigPlanQueued = Signal(object)
+    sigPlanDequeued = Signal(str)
 
-    def __init__(self, **kwargs):
+    def __init__(self, workers=2, **kwargs):
         super(QRunEngine, self).__init__()
 
-        self.RE = RunEngine(context_managers=[], **kwargs)
-        self.RE.subscribe(self.sigDocumentYield.emit)
-
-        self.queue = PriorityQueue()
-
-        self.process_queue()
-
-    @threads.method(threadkey="run_engine", showBusy=False)
-    def process_queue(self):
+        # Attached by replay(); until then nothing is journaled
+        self.journal = None
+
+        # The workers share one metadata mapping and scan_id sequence, so runs are numbered as if by one RunEngine
+        md = kwargs.pop('md', None)
+        self.md = dict() if md is None else md
+        self._scan_id_lock = threading.Lock()
+        kwargs.setdefault('scan_id_source', self._next_scan_id)
+        # Each RunEngine gets its own event loop, so the workers don't take turns on a shared one
+        self.workers = [RunEngine(context_managers=[], md=self.md, loop=asyncio.new_event_loop(), **kwargs)
+                        for _ in range(workers)]
+        # Documents are logged in the worker that produced them, not relayed to the GUI thread to be logged there
+        self.documentLogger = DocumentLogger()
+        for RE in self.workers:
+            RE.subscribe(self.sigDocumentYield.emit)
+            RE.subscribe(self.documentLogger)
+        # The primary RunEngine; kept for code that talks to a single RunEngine
+        self.RE = self.workers[0]
+
+        self.queue = PlanQueue()
+        self._condition = threading.Condition()
+        self._busy_devices = set()
+        self._running = 0
+        self._exclusive = False
+        self._shutdown = False
+        # Per-worker control channel, and the plan each worker is holding while paused
+        self._commands = [collections.deque() for _ in self.workers]
+        self._paused = [None for _ in self.workers]
+
+        self._worker_threads = [threads.QThreadFuture(self.process_queue, i,
+                                                      threadkey=f'run_engine-{i}',
+                                                      showBusy=False)
+                                for i, RE in enumerate(self.workers)]
+        for thread in self._worker_threads:
+            thread.start()
+
+        app = QApplication.instance()
+        if app:
+            app.aboutToQuit.connect(self.shutdown)
+
+    def _next_scan_id(self, md):
+        with self._scan_id_lock:
+            md['scan_id'] = md.get('scan_id', 0) + 1
+            return md['scan_id']
+
+    def _runnable(self, priority_plan):
+        # Called with the condition held: True to run the plan now, False to skip it, None if nothing may overtake it
+        if priority_plan.devices is None:
+            return None if self._running else True
+        return not priority_plan.devices & self._busy_devices
+
+    def _next_plan(self):
+        # Called with the condition held; claims and returns the first runnable plan, if any
+        if self._shutdown:
+            return _SHUTDOWN
+        if self._exclusive:
+            return None
+        priority_plan = self.queue.take(self._runnable)
+        if priority_plan is None:
+            return None
+        if priority_plan.devices is None:
+            self._exclusive = True
+        else:
+            self._busy_devices |= priority_plan.devices
+        self._running += 1
+        return priority_plan
+
+    def _release(self, priority_plan):
+        with self._condition:
+            if priority_plan.devices is None:
+                self._exclusive = False
+            else:
+                self._busy_devices -= priority_plan.devices
+            self._running -= 1
+            self._condition.notify_all()
+
+    def _next_command(self, index):
+        # Called with the condition held; a paused worker only takes commands, an idle one also takes new plans
+        if self._shutdown:
+            return _SHUTDOWN
+        if self._commands[index]:
+            return self._commands[index].popleft()
+        if self._paused[index] is not None:
+            return None
+        return self._next_plan()
+
+    def process_queue(self, index):
+        RE = self.workers[index]
         while True:
-            try:
-                priority_plan = self.queue.get(block=True, timeout=.1)  # timeout is arbitrary, we'll come right back
-            except Empty:
+            # Block until a command arrives or a plan that can run is submitted or released; put() wakes us immediately
+            with self._condition:
+                command = self._condition.wait_for(lambda: self._next_command(index))
+            if command is _SHUTDOWN:
+                break
+
+            if isinstance(command, PrioritizedPlan):
+                priority_plan = command
+                self.sigPlanDequeued.emit(priority_plan.id)
+                args, kwargs = priority_plan.args
+                if priority_plan.journaled:
+                    self.journal.started(priority_plan.id)
+                self.sigStart.emit()
+                self._execute(index, priority_plan, partial(RE, *args, **kwargs))
                 continue
-            priority, (args, kwargs) = priority_plan.priority, priority_plan.args
 
-            self.sigStart.emit()
-            try:
-                self.RE(*args, **kwargs)
-            except Exception as ex:
-                msg.showMessage("An error occured during a Bluesky plan. See the Xi-CAM log for details.")
-                msg.logError(ex)
-                self.sigException.emit(ex)
-            self.sigFinish.emit()
+            priority_plan = self._paused[index]
+            if priority_plan is None or RE.state != 'paused':
+                continue  # stale command; the plan already finished
+            if command == _RESUME:
+                self.sigResume.emit()
+                self._execute(index, priority_plan, RE.resume)
+            else:
+                _, reason = command
+                self._execute(index, priority_plan, partial(RE.abort, reason=reason))
+
+    def _execute(self, index, priority_plan, call):
+        # Run (or resume/abort) a plan on this worker's RunEngine; if it pauses, hold on to it until a command comes
+        RE = self.workers[index]
+        try:
+            call()
+        except RunEngineInterrupted:
+            if RE.state == 'paused':
+                with self._condition:
+                    self._paused[index] = priority_plan
+                self.sigPause.emit()
+                return
+        except Exception as ex:
+            msg.showMessage("An error occured during a Bluesky plan. See the Xi-CAM log for details.")
+            msg.logError(ex)
+            self.sigException.emit(ex)
+
+        with self._condition:
+            self._paused[index] = None
+        self._release(priority_plan)
+        if priority_plan.journaled:
+            self.journal.finished(priority_plan.id)
+        self.sigFinish.emit()
+
+    def _command(self, index, command):
+        with self._condition:
+            self._commands[index].append(command)
+            self._condition.notify_all()
 
     def __call__(self, *args, **kwargs):
-        self.put(*args, **kwargs)
+        return self.put(*args, **kwargs)
 
     @property
     def isIdle(self):
-        return self.RE.state == 'idle'
+        return all(RE.state == 'idle' for RE in self.workers)
 
     def abort(self, reason=''):
-        if self.RE.state != 'idle':
-            self.RE.abort(reason=reason)
+        aborted = False
+        for i, RE in enumerate(self.workers):
+            if RE.state == 'paused':
+                # A paused RunEngine is aborted by the worker that owns it
+                self._command(i, (_ABORT, reason))
+                aborted = True
+            elif RE.state != 'idle':
+                # A running RunEngine is blocked in its worker; interrupt it (thread-safe)
+                RE.abort(reason=reason)
+                aborted = True
+        if aborted:
             self.sigAbort.emit()
 
     def pause(self, defer=False):
-        if self.RE.state != 'paused':
-            self.RE.request_pause(defer)
-            self.sigPause.emit()
+        # The request is thread-safe; the worker emits sigPause once the RunEngine has actually paused
+        for RE in self.workers:
+            if RE.state == 'running':
+                RE.request_pause(defer)
 
     def resume(self, ):
-        if self.RE.state == 'paused':
-            self.threadfuture = threads.QThreadFuture(self.RE.resume,
-                                                      threadkey='RE',
-                                                      showBusy=True,
-                                                      finished_slot=self.sigFinish.emit)
-            self.threadfuture.start()
-            self.sigResume.emit()
-
-    def put(self, *args, priority=1, **kwargs):
+        for i, RE in enumerate(self.workers):
+            if RE.state == 'paused':
+                self._command(i, _RESUME)
+
+    def put(self, *args, priority=1, devices=None, planitem=None, **kwargs):
         # handle ParameterizedPlan's
         # plan = args[0]
         # if isinstance(args[0], ParameterizedPlan):
@@ -121,12 +263,95 @@ class QRunEngine(QObject):
         #     if param:
         #         ParameterDialog(param).exec_()
 
-        self.queue.put(PrioritizedPlan(priority, (args, kwargs)))
-
-
-
+        devices = self._roots(devices)
+        name = getattr(args[0], '__name__', type(args[0]).__name__) if args else ''
+        # Plans that can be rebuilt from their PlanItem are journaled so they survive a crash
+        journaled = bool(self.journal and planitem and planitem.code)
+        priority_plan = PrioritizedPlan(priority, (args, kwargs), devices, name, journaled=journaled)
+        if journaled:
+            self.journal.queued(priority_plan.id, priority, planitem.__reduce__()[1])
+        self._enqueue(priority_plan)
+        return priority_plan.id
+
+    @staticmethod
+    def _roots(devices):
+        # Lock whole devices; two plans using different components of one device still conflict
+        if devices is None:
+            return None
+        return {getattr(device, 'root', device) for device in devices}
+
+    def _enqueue(self, priority_plan):
+        with self._condition:
+            self.queue.put(priority_plan)
+            self._condition.notify_all()
+            # Emitted before a worker can take the plan, so views see it queued before they see it dequeued
+            self.sigPlanQueued.emit(priority_plan)
+
+    def replay(self, journal):
+        """
+        Journal plans to ``journal`` from now on, and re-queue the plans it recorded as still queued or running when
+        the last session ended.
+        """
+        from .plans.planitem import PlanItem
+
+        # Read back what the last session left unfinished before anything new is journaled
+        unfinished = journal.recover()
+        self.journal = journal
+        for plan_id, priority, plan_args in unfinished:
+            planitem = PlanItem(*plan_args)
+            try:
+                plan = planitem.make_plan()
+            except Exception as ex:
+                msg.logError(ex)
+                self.journal.cancelled(plan_id)
+                continue
+            self._enqueue(PrioritizedPlan(priority, ((plan,), {}), self._roots(planitem.devices), planitem.name,
+                                          id=plan_id, journaled=True))
+        if unfinished:
+            msg.showMessage(f'Re-queued {len(unfinished)} unfinished plan(s) from the last session.')
 
+    @property
+    def pending(self):
+        # The queued plans in the order they'll be considered
+        with self._condition:
+            return list(self.queue)
+
+    def cancel(self, plan_id):
+        # Remove a plan from the queue (not the running plan; see abort)
+        with self._condition:
+            priority_plan = self.queue.cancel(plan_id)
+        if priority_plan is None:
+            return False
+        if priority_plan.journaled:
+            self.journal.cancelled(plan_id)
+        self.sigPlanDequeued.emit(plan_id)
+        return True
+
+    def reprioritize(self, plan_id, priority):
+        with self._condition:
+            priority_plan = self.queue.reprioritize(plan_id, priority)
+            self._condition.notify_all()
+            if priority_plan is not None:
+                self.sigPlanQueued.emit(priority_plan)
+        if priority_plan is None:
+            return False
+        if self.journal:
+            self.journal.reprioritized(plan_id, priority)
+        return True
+
+    def shutdown(self, timeout=5.):
+        # Stop the workers once their current plans (if any) return; pending plans are left in the queue
+        with self._condition:
+            self._shutdown = True
+            self._condition.notify_all()
+        # Let running plans record that they finished before the journal closes; a plan still running after
+        # ``timeout`` is left unfinished in the journal and replayed next session, as after a crash
+        deadline = time.monotonic() + timeout
+        for thread in self._worker_threads:
+            if not thread.wait(max(0, int((deadline - time.monotonic()) * 1000))):
+                msg.logMessage('A plan was still running when the run engine shut down.', level=msg.WARNING)
+        if self.journal:
+            self.journal.close()
 
 
 RE = QRunEngine()
-RE.sigDocumentYield.connect(partial(msg.logMessage, level=msg.DEBUG))